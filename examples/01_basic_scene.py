@@ -1,28 +1,10 @@
 import sys
-import os
-
-# Add src to path
-# Assuming this script is run from project root or examples/
-# We add both possible paths to cover running from root or examples/
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_path = os.path.join(current_dir, '../vla_synthesis/src')
-if src_path not in sys.path:
-    sys.path.append(src_path)
-
-# Also try adding vla_synthesis/src if run from root and examples is a subdir
-root_src_path = os.path.join(os.getcwd(), 'vla_synthesis/src')
-if root_src_path not in sys.path:
-    sys.path.append(root_src_path)
 
 try:
-    from scene_manager import SceneManager
+    from vla_synthesis import SceneManager
 except ImportError:
-    # If standard import fails, try relative (less robust but helpful)
-    try:
-        from vla_synthesis.src.scene_manager import SceneManager
-    except ImportError:
-        print("Could not import SceneManager. Please ensure PYTHONPATH includes 'vla_synthesis/src'.")
-        sys.exit(1)
+    print("Could not import vla_synthesis. Install it with 'pip install -e .' from the repository root.")
+    sys.exit(1)
 
 def main():
     print("Example 1: Basic Scene Loading")
@@ -1,25 +1,10 @@
 import sys
-import os
 import time
 
-# Add src to path
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# If run from project root, use vla_synthesis/src
-# If run from examples/, use ../vla_synthesis/src
-# This allows running from both places
-if os.path.exists(os.path.join(current_dir, '../vla_synthesis/src')):
-    sys.path.append(os.path.join(current_dir, '../vla_synthesis/src'))
-elif os.path.exists(os.path.join(current_dir, 'vla_synthesis/src')): # run from root
-    sys.path.append(os.path.join(current_dir, 'vla_synthesis/src'))
-else:
-    # Try assuming current_dir IS root/examples so project root is ..
-    sys.path.append(os.path.join(current_dir, '..', 'vla_synthesis', 'src'))
-
 try:
-    from scene_manager import SceneManager
-    from task_generator import TaskGenerator
+    from vla_synthesis import SceneManager, TaskGenerator
 except ImportError:
-    print("Could not import modules. Ensure PYTHONPATH includes 'vla_synthesis/src'.")
+    print("Could not import vla_synthesis. Install it with 'pip install -e .' from the repository root.")
     sys.exit(1)
 
 def main():
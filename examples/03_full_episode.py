@@ -1,35 +1,12 @@
 import sys
-import os
 import numpy as np
 
-# Add src to path
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# Check for common locations
-paths_to_check = [
-    os.path.join(current_dir, '../vla_synthesis/src'), # Run from examples/
-    os.path.join(current_dir, 'vla_synthesis/src'),    # Run from root/
-    os.path.join(current_dir, '../src'),               # If structure differs
-]
-
-for p in paths_to_check:
-    if os.path.exists(p) and p not in sys.path:
-        sys.path.append(p)
-
 try:
-    from scene_manager import SceneManager
-    from task_generator import TaskGenerator
-    from planner import SimplePlanner
-    from recorder import HDF5Recorder
+    from vla_synthesis import HDF5Recorder, SceneManager, SimplePlanner, TaskGenerator
+    from vla_synthesis.src.utils import find_method
 except ImportError:
-    # Try importing from package
-    try:
-        from vla_synthesis.src.scene_manager import SceneManager
-        from vla_synthesis.src.task_generator import TaskGenerator
-        from vla_synthesis.src.planner import SimplePlanner
-        from vla_synthesis.src.recorder import HDF5Recorder
-    except ImportError:
-        print("Could not import vla_synthesis modules. Please check PYTHONPATH.")
-        sys.exit(1)
+    print("Could not import vla_synthesis. Install it with 'pip install -e .' from the repository root.")
+    sys.exit(1)
 
 def main():
     print("Example 3: Full Episode Simulation")
@@ -63,10 +40,9 @@ def main():
 
             # Get target position
             # Handle potential API differences
-            if hasattr(target_obj, 'get_pos'):
-                 target_pos = np.array(target_obj.get_pos())
-            elif hasattr(target_obj, 'get_position'):
-                 target_pos = np.array(target_obj.get_position())
+            get_target_pos = find_method(target_obj, ('get_position', 'get_pos'))
+            if get_target_pos is not None:
+                 target_pos = np.array(get_target_pos())
             else:
                  # Fallback for testing without real physics
                  print("Warning: target_obj has no position method. Using mock position.")
@@ -85,8 +61,11 @@ def main():
                 print("Using mock trajectory for demonstration.")
                 actions = [np.zeros(9) for _ in range(50)]
 
+            # Resolve the robot control method once, not on every step
+            apply_action = find_method(scene.robot, ('control_dofs_position', 'control_joints', 'set_q'))
+
             # Execute and Record
-            recorder.create_episode_group(episode_idx)
+            recorder.create_episode_group(episode_idx, instruction=instr)
 
             step_count = 0
             for action in actions:
@@ -95,12 +74,8 @@ def main():
                     print(f"Executing step {step_count}/{len(actions)}")
 
                 # Apply action
-                if hasattr(scene.robot, 'control_dofs_position'):
-                    scene.robot.control_dofs_position(action)
-                elif hasattr(scene.robot, 'control_joints'):
-                    scene.robot.control_joints(action)
-                elif hasattr(scene.robot, 'set_q'):
-                     scene.robot.set_q(action)
+                if apply_action is not None:
+                    apply_action(action)
 
                 # Step physics
                 scene.step()
@@ -118,6 +93,9 @@ def main():
                 )
                 step_count += 1
 
+            # Write the buffered episode to disk
+            recorder.close_episode(episode_idx)
+
             print(f"Episode {episode_idx} completed.")
 
         print("Full episode simulation finished successfully.")
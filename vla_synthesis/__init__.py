@@ -0,0 +1,19 @@
+import importlib
+
+# Public classes, imported on first access so that importing the package
+# does not load Genesis or h5py until they are actually used
+_EXPORTS = {
+    'SceneManager': 'scene_manager',
+    'TaskGenerator': 'task_generator',
+    'SimplePlanner': 'planner',
+    'HDF5Recorder': 'recorder',
+    'EpisodeBuffer': 'recorder',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(f'.src.{_EXPORTS[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,39 +1,206 @@
-import sys
 import os
 import numpy as np
 import warnings
-
-# Ensure src is in path to allow imports
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_path = os.path.join(current_dir, 'src')
-if src_path not in sys.path:
-    sys.path.append(src_path)
-
-from scene_manager import SceneManager
-from task_generator import TaskGenerator
-from planner import SimplePlanner
-from recorder import HDF5Recorder
-
-def main():
-    # Configuration
-    NUM_EPISODES = 1000
-    MAX_STEPS = 200
+from concurrent.futures import ProcessPoolExecutor
+
+from vla_synthesis import HDF5Recorder, SceneManager, SimplePlanner, TaskGenerator
+from vla_synthesis.src.utils import find_method
+
+# Configuration
+NUM_EPISODES = 1000
+MAX_STEPS = 200
+SAVE_PATH = "vla_dataset.h5"
+# Episodes are independent, so with NUM_WORKERS > 1 each worker process
+# generates whole episodes into its own shard file under SHARD_DIR
+NUM_WORKERS = 1
+SHARD_DIR = "shards"
+
+# Target position of the current episode, reused across episodes to avoid an
+# allocation per episode. Only read by the planner.
+_target_pos_buf = np.empty(3, dtype=np.float64)
+
+def init_components():
+    """
+    Create the scene, task generator and planner used to generate episodes.
+
+    Returns:
+        tuple: (scene, task_gen, planner)
+    """
+    # We use debug=False for faster generation without GUI
+    scene = SceneManager(debug=False)
+
+    # Load the robot and ground plane
+    scene.load_robot()
+
+    return scene, TaskGenerator(), SimplePlanner()
+
+def run_episode(scene, task_gen, planner, recorder, ep):
+    """
+    Generate and record a single episode.
+
+    Args:
+        scene (SceneManager): Scene with the robot loaded.
+        task_gen (TaskGenerator): Task generator.
+        planner (SimplePlanner): Trajectory planner.
+        recorder (HDF5Recorder): Recorder the episode is written to.
+        ep (int): Episode index.
+
+    Returns:
+        str: The episode instruction, or None if the episode was skipped.
+    """
+    # 1. Reset Environment
+    # Reset scene (randomizes camera and lighting)
+    scene.reset()
+
+    # Generate new task
+    # We pass the underlying genesis scene object to TaskGenerator
+    # reset_task returns instruction and target object entity
+    text_instr, target_obj = task_gen.reset_task(scene.scene)
+
+    if target_obj is None:
+        warnings.warn(f"Episode {ep}: Failed to generate task (target_obj is None). Skipping.")
+        return None
+
+    # 2. Plan Expert Trajectory
+    # Get target position. Attempt get_position() as per prompt, fallback to get_pos()
+    get_target_pos = find_method(target_obj, ('get_position', 'get_pos'))
+    if get_target_pos is not None:
+        _target_pos_buf[:] = get_target_pos()
+        target_pos = _target_pos_buf
+    else:
+        # Fallback if neither exists (e.g. during mock/testing without real genesis)
+        # Assuming [0.5, 0, 0.05] as a safe default for testing
+        warnings.warn(f"Episode {ep}: target_obj has no get_position/get_pos. Using default.")
+        target_pos = np.array([0.5, 0.0, 0.05])
+
+    # Plan grasp trajectory
+    actions_trajectory = planner.plan_grasp(scene.robot, target_pos)
+
+    # Resolve the robot control method once rather than on every step
+    # Use control_dofs_position if available, or control_joints if per prompt
+    apply_action = find_method(scene.robot, ('control_dofs_position', 'control_joints', 'set_q'))
+    if apply_action is None:
+        warnings.warn(f"Episode {ep}: robot has no position control method. Actions are recorded but not applied.")
+        apply_action = lambda action: None
+
+    # 3. Execute and Record
+    recorder.create_episode_group(ep, instruction=text_instr)
+
+    # The trajectory is a contiguous (N, 9) float64 array, so each step hands
+    # the controller a row view at full precision. The recorder casts it to
+    # float32 while copying it into its buffer.
+    for action in actions_trajectory[:MAX_STEPS]:
+        # Control robot
+        apply_action(action)
+
+        # Step simulation
+        scene.step()
+
+        # Render observations. The recorder copies them to the host on its
+        # writer thread, so the frames may stay on the device here.
+        rgb, depth, mask = scene.render(to_numpy=False)
+
+        # Save step data
+        recorder.save_step(
+            episode_idx=ep,
+            observation=rgb,
+            action=action,
+            instruction=text_instr,
+            reward=0.0 # Placeholder reward
+        )
+
+    # Write the buffered episode to disk and trim unused rows
+    recorder.close_episode(ep)
+
+    return text_instr
+
+# Components of the current worker process, created once by _init_worker
+_worker_components = None
+
+def _init_worker():
+    global _worker_components
+    _worker_components = init_components()
+
+def generate_episode(ep_idx, seed=None):
+    """
+    Generate one episode into its own shard file. Runs in a worker process.
+
+    Args:
+        ep_idx (int): Episode index.
+        seed (int, optional): Seed for the task and domain randomization.
+            Defaults to the episode index, so shards are reproducible.
+
+    Returns:
+        str: Path of the shard file, or None if the episode failed.
+    """
+    seed = ep_idx if seed is None else seed
+    np.random.seed(seed)
+
+    scene, task_gen, planner = _worker_components
+    scene.seed(seed)
+    task_gen.seed(seed)
+    shard_path = os.path.join(SHARD_DIR, f"ep_{ep_idx:06d}.h5")
+    try:
+        # A shard holds a single episode, small enough to build in memory
+        with HDF5Recorder(shard_path, max_steps=MAX_STEPS, in_memory=True) as recorder:
+            # Same vocabulary in every shard, so instruction IDs agree
+            recorder.register_instructions(task_gen.instruction_vocabulary())
+            text_instr = run_episode(scene, task_gen, planner, recorder, ep_idx)
+    except Exception as e:
+        print(f"Episode {ep_idx} failed ({type(e).__name__}): {e}")
+        return None
+
+    if text_instr is None:
+        return None
+    print(f"Episode {ep_idx} generated: {text_instr}")
+    return shard_path
+
+def concatenate_shards(shard_paths, save_path):
+    """
+    Expose the episodes of all shard files in a single HDF5 file.
+
+    Episodes are added as external links, so no data is copied. Shards are
+    referenced relative to `save_path` and must stay next to it. The shards'
+    instruction vocabulary is copied to `save_path`, so the episodes'
+    instruction IDs can be resolved from it.
+
+    Args:
+        shard_paths (list): Paths of the shard files.
+        save_path (str): Path of the combined HDF5 file.
+
+    Raises:
+        ValueError: If the shards have different instruction vocabularies.
+    """
+    import h5py
+
+    save_dir = os.path.dirname(os.path.abspath(save_path))
+    vocab = None
+    with h5py.File(save_path, 'a') as f:
+        for path in shard_paths:
+            with h5py.File(path, 'r') as shard:
+                names = list(shard)
+                shard_vocab = shard.attrs.get('instruction_vocab')
+            if shard_vocab is not None:
+                if vocab is None:
+                    vocab = shard_vocab
+                elif list(shard_vocab) != list(vocab):
+                    raise ValueError(f"Shard {path} has a different instruction vocabulary")
+            rel_path = os.path.relpath(os.path.abspath(path), save_dir)
+            for name in names:
+                if name in f:
+                    del f[name]
+                f[name] = h5py.ExternalLink(rel_path, name)
+        if vocab is not None:
+            f.attrs['instruction_vocab'] = vocab
+
+def main(num_workers=NUM_WORKERS, num_episodes=NUM_EPISODES):
+    if num_workers > 1:
+        main_parallel(num_workers, num_episodes)
+        return
 
     print("Initializing components...")
     try:
-        # Initialize SceneManager
-        # We use debug=False for faster generation without GUI
-        scene = SceneManager(debug=False)
-
-        # Load the robot and ground plane
-        scene.load_robot()
-
-        # Initialize Task Generator and Planner
-        task_gen = TaskGenerator()
-        planner = SimplePlanner()
-
-        # Initialize Recorder
-        recorder = HDF5Recorder("vla_dataset.h5")
+        scene, task_gen, planner = init_components()
 
     except ImportError as e:
         print(f"Initialization failed (ImportError): {e}")
@@ -43,86 +210,44 @@ def main():
         print(f"Initialization error: {e}")
         return
 
-    print(f"Starting generation of {NUM_EPISODES} episodes...")
-
-    for ep in range(NUM_EPISODES):
-        try:
-            # 1. Reset Environment
-            # Reset scene (randomizes camera and lighting)
-            scene.reset()
-
-            # Generate new task
-            # We pass the underlying genesis scene object to TaskGenerator
-            # reset_task returns instruction and target object entity
-            text_instr, target_obj = task_gen.reset_task(scene.scene)
-
-            # Explicitly randomize lighting as per requirements (though reset() does it too)
-            scene.randomize_lighting()
-
-            if target_obj is None:
-                warnings.warn(f"Episode {ep}: Failed to generate task (target_obj is None). Skipping.")
+    print(f"Starting generation of {num_episodes} episodes...")
+
+    # The context manager closes the file even if generation is interrupted,
+    # so the HDF5 metadata is always flushed deterministically
+    with HDF5Recorder(SAVE_PATH, max_steps=MAX_STEPS) as recorder:
+        recorder.register_instructions(task_gen.instruction_vocabulary())
+        for ep in range(num_episodes):
+            try:
+                text_instr = run_episode(scene, task_gen, planner, recorder, ep)
+                if text_instr is not None:
+                    print(f"Episode {ep} generated: {text_instr}")
+
+            except RuntimeError as e:
+                # Catch IK failures or other runtime errors
+                print(f"Episode {ep} failed (RuntimeError): {e}")
+                continue
+            except Exception as e:
+                print(f"Episode {ep} failed (Unexpected): {e}")
                 continue
 
-            # 2. Plan Expert Trajectory
-            # Get target position. Attempt get_position() as per prompt, fallback to get_pos()
-            if hasattr(target_obj, 'get_position'):
-                target_pos = target_obj.get_position()
-            elif hasattr(target_obj, 'get_pos'):
-                target_pos = target_obj.get_pos()
-            else:
-                # Fallback if neither exists (e.g. during mock/testing without real genesis)
-                # Assuming [0.5, 0, 0.05] as a safe default for testing
-                warnings.warn(f"Episode {ep}: target_obj has no get_position/get_pos. Using default.")
-                target_pos = np.array([0.5, 0.0, 0.05])
-
-            # Plan grasp trajectory
-            actions_trajectory = planner.plan_grasp(scene.robot, target_pos)
-
-            # 3. Execute and Record
-            recorder.create_episode_group(ep)
-
-            step_count = 0
-            for action in actions_trajectory:
-                if step_count >= MAX_STEPS:
-                    break
-
-                # Control robot
-                # Use control_dofs_position if available, or control_joints if per prompt
-                if hasattr(scene.robot, 'control_dofs_position'):
-                    scene.robot.control_dofs_position(action)
-                elif hasattr(scene.robot, 'control_joints'):
-                    scene.robot.control_joints(action)
-                elif hasattr(scene.robot, 'set_q'):
-                     scene.robot.set_q(action)
-
-                # Step simulation
-                scene.step()
-
-                # Render observations
-                rgb, depth, mask = scene.render()
-
-                # Save step data
-                recorder.save_step(
-                    episode_idx=ep,
-                    observation=rgb,
-                    action=action,
-                    instruction=text_instr,
-                    reward=0.0 # Placeholder reward
-                )
-                step_count += 1
-
-            print(f"Episode {ep} generated: {text_instr}")
-
-        except RuntimeError as e:
-            # Catch IK failures or other runtime errors
-            print(f"Episode {ep} failed (RuntimeError): {e}")
-            continue
-        except Exception as e:
-            print(f"Episode {ep} failed (Unexpected): {e}")
-            continue
-
-    recorder.close()
     print("Data generation complete.")
 
+def main_parallel(num_workers, num_episodes=NUM_EPISODES):
+    """
+    Generate episodes in `num_workers` processes, each with its own scene,
+    then link the per-episode shards into SAVE_PATH.
+    """
+    print(f"Starting generation of {num_episodes} episodes on {num_workers} workers...")
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker) as executor:
+            shard_paths = [p for p in executor.map(generate_episode, range(num_episodes)) if p is not None]
+    except Exception as e:
+        print(f"Parallel generation failed: {e}")
+        return
+
+    concatenate_shards(shard_paths, SAVE_PATH)
+    print(f"Data generation complete: {len(shard_paths)} episodes linked into {SAVE_PATH}.")
+
 if __name__ == "__main__":
     main()
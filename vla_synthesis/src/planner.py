@@ -1,14 +1,63 @@
+import inspect
 import numpy as np
 import warnings
 
+# Constants shared by every plan_grasp call, allocated once at import
+_DOWN_QUAT = np.array([0., 1., 0., 0.])  # Gripper pointing down (w, x, y, z)
+_PRE_OFFSET = np.array([0., 0., 0.1])    # Pre-grasp/lift height above the object
+_OPEN_V = 0.04                           # Finger position when open
+_CLOSED_V = 0.0                          # Finger position when closed
+_MOVE_STEPS = 50                         # Steps per arm motion segment
+_CLOSE_STEPS = 20                        # Steps to close the gripper
+
+def _accepts_keyword(fn, name):
+    """Whether `fn` can be called with keyword argument `name`."""
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        # No introspectable signature, so do not risk an unsupported call
+        return False
+    return any(p.name == name or p.kind is p.VAR_KEYWORD for p in params)
+
 class SimplePlanner:
     def __init__(self):
         """
         Initialize the SimplePlanner.
         """
-        pass
+        # Whether the robot's IK solver accepts several targets in one call,
+        # and whether it accepts an initial guess. Probed on first use.
+        self._batched_ik = None
+        self._ik_warm_start = None
+
+    def _solve_ik_batch(self, robot, positions, quat, dof):
+        """
+        Solve IK for all target positions in a single solver call.
 
-    def interpolate(self, start_q, end_q, steps):
+        Returns:
+            np.ndarray: Joint configurations of shape (N, dof), or None if the
+                robot does not support batched targets or the batched solve
+                failed.
+        """
+        if self._batched_ik is False or not hasattr(robot, 'inverse_kinematics'):
+            return None
+        try:
+            quats = np.broadcast_to(quat, (len(positions), len(quat)))
+            # Copy so callers own the rows and may modify them in place
+            q = np.array(robot.inverse_kinematics(link=None, pos=positions, quat=quats))
+        except (TypeError, AttributeError):
+            # The solver does not take several targets at once
+            q = None
+        except Exception:
+            # E.g. an unreachable target: says nothing about batching, so
+            # solve sequentially this time, where a real error is raised again
+            return None
+        if q is None or q.shape != (len(positions), dof):
+            self._batched_ik = False
+            return None
+        self._batched_ik = True
+        return q
+
+    def interpolate(self, start_q, end_q, steps, out=None):
         """
         Linearly interpolate between two joint configurations.
 
@@ -16,19 +65,25 @@ class SimplePlanner:
             start_q (np.ndarray): Starting joint configuration.
             end_q (np.ndarray): Ending joint configuration.
             steps (int): Number of steps in the interpolation.
+            out (np.ndarray, optional): Pre-allocated float64 array of shape
+                (steps, D) to write the configurations into.
 
         Returns:
-            list: List of joint configurations.
+            np.ndarray: Joint configurations of shape (steps, D).
         """
-        start_q = np.array(start_q)
-        end_q = np.array(end_q)
-        trajectory = []
-        for i in range(steps):
-            # Linear interpolation: q(t) = (1-t)*start + t*end
-            t = i / (steps - 1) if steps > 1 else 0
-            q = (1 - t) * start_q + t * end_q
-            trajectory.append(q)
-        return trajectory
+        start_q = np.ascontiguousarray(start_q, dtype=np.float64)
+        end_q = np.ascontiguousarray(end_q, dtype=np.float64)
+        if out is None:
+            return np.linspace(start_q, end_q, steps)
+
+        # Same as np.linspace, written in place: q(t) = start + t*(end - start),
+        # with only a (D,) temporary and the last row exactly at end_q
+        t = np.linspace(0.0, 1.0, steps)[:, None]
+        np.multiply(t, end_q - start_q, out=out)
+        out += start_q
+        if steps > 1:
+            out[-1] = end_q
+        return out
 
     def plan_grasp(self, robot, target_position):
         """
@@ -37,16 +92,19 @@ class SimplePlanner:
         Args:
             robot: The robot entity (Genesis morph).
             target_position (list or np.ndarray): Target position [x, y, z].
+                Treated as read-only and not copied, so callers may pass a
+                reused buffer.
 
         Returns:
-            list: A list of joint configurations (actions) for the entire episode.
+            np.ndarray: Joint configurations (actions) for the entire episode,
+                one row per step.
         """
-        # Ensure target_position is a numpy array
-        target_pos = np.array(target_position)
+        # Ensure target_position is a numpy array (no copy, never modified)
+        target_pos = np.asarray(target_position)
 
         # 1. Define Key Poses
         # Pre-grasp: 10cm above object
-        pre_grasp_pos = target_pos + np.array([0, 0, 0.1])
+        pre_grasp_pos = target_pos + _PRE_OFFSET
 
         # Grasp: At object
         grasp_pos = target_pos
@@ -64,7 +122,7 @@ class SimplePlanner:
         # Given we lack docs, we'll try a standard one.
         # Using [0, 1, 0, 0] (w, x, y, z) -> 180 deg around X?
         # Let's use a dummy quaternion and rely on IK solver to handle it or fail gracefully.
-        down_quat = np.array([0, 1, 0, 0])
+        down_quat = _DOWN_QUAT
 
         # 2. Calculate Joint Angles using IK
         try:
@@ -78,64 +136,72 @@ class SimplePlanner:
                 warnings.warn("robot.get_q() not found. Using zero configuration.")
 
             # Helper to call IK safely
-            def solve_ik(pos, quat):
+            def solve_ik(pos, quat, init_q=None):
                 if hasattr(robot, 'inverse_kinematics'):
                     # Assume signature: link (optional), pos, quat
                     # We pass link=None to imply end-effector
-                    # Check signature via inspection if possible, but here we just try
-                    q = robot.inverse_kinematics(link=None, pos=pos, quat=quat)
+                    if init_q is not None and self._ik_warm_start is None:
+                        # Decided from the signature, so a TypeError raised
+                        # inside the solver is not taken as "unsupported"
+                        self._ik_warm_start = _accepts_keyword(robot.inverse_kinematics, 'init_qpos')
+                    if init_q is not None and self._ik_warm_start:
+                        # Warm start from the previous keyframe; consecutive
+                        # targets are only 10cm apart, so this converges faster
+                        q = robot.inverse_kinematics(link=None, pos=pos, quat=quat, init_qpos=init_q)
+                    else:
+                        q = robot.inverse_kinematics(link=None, pos=pos, quat=quat)
                     return np.array(q)
                 else:
                     # Mock behavior for testing if method missing
                     warnings.warn("robot.inverse_kinematics not found. Returning random configuration.")
                     return np.random.uniform(-1, 1, size=len(home_q))
 
-            pre_grasp_q = solve_ik(pre_grasp_pos, down_quat)
-            grasp_q = solve_ik(grasp_pos, down_quat)
-            lift_q = solve_ik(lift_pos, down_quat)
+            # All keyframes share one orientation, so try one batched solve
+            # first and fall back to warm-started sequential solves
+            keyframe_q = self._solve_ik_batch(
+                robot, np.stack([pre_grasp_pos, grasp_pos, lift_pos]), down_quat, len(home_q)
+            )
+            if keyframe_q is not None:
+                pre_grasp_q, grasp_q, lift_q = keyframe_q
+            else:
+                pre_grasp_q = solve_ik(pre_grasp_pos, down_quat, home_q)
+                grasp_q = solve_ik(grasp_pos, down_quat, pre_grasp_q)
+                lift_q = solve_ik(lift_pos, down_quat, grasp_q)
 
             # Ensure gripper is open for these keyframes (last 2 joints)
             # Assuming last 2 are gripper fingers and open is e.g. 0.04
-            open_val = 0.04
-            closed_val = 0.0
-
-            # Helper to set gripper
+            # Helper to set gripper. The IK results are fresh arrays owned by
+            # this call, so they are updated in place rather than copied.
             def set_gripper(q, val):
-                q_copy = q.copy()
-                if len(q_copy) >= 2:
-                    q_copy[-2:] = val
-                return q_copy
+                if len(q) >= 2:
+                    q[-2:] = val
+                return q
 
-            pre_grasp_q = set_gripper(pre_grasp_q, open_val)
-            grasp_q = set_gripper(grasp_q, open_val)
-            lift_q = set_gripper(lift_q, closed_val)
+            pre_grasp_q = set_gripper(pre_grasp_q, _OPEN_V)
+            grasp_q = set_gripper(grasp_q, _OPEN_V)
+            lift_q = set_gripper(lift_q, _CLOSED_V)
 
         except Exception as e:
             raise RuntimeError(f"IK solving failed: {e}")
 
         # 3. Interpolate Trajectories
-        steps_per_segment = 50
-
-        # Home -> Pre-grasp
-        traj_home_to_pre = self.interpolate(home_q, pre_grasp_q, steps_per_segment)
-
-        # Pre-grasp -> Grasp
-        traj_pre_to_grasp = self.interpolate(pre_grasp_q, grasp_q, steps_per_segment)
-
         # Close Gripper
         # We simulate closing by interpolating from open to closed configuration at the same pose
-        grasp_q_closed = set_gripper(grasp_q, closed_val)
-        traj_close_gripper = self.interpolate(grasp_q, grasp_q_closed, 20)
-
-        # Grasp -> Lift
-        traj_grasp_to_lift = self.interpolate(grasp_q_closed, lift_q, steps_per_segment)
-
-        # Combine all
-        full_trajectory = (
-            traj_home_to_pre +
-            traj_pre_to_grasp +
-            traj_close_gripper +
-            traj_grasp_to_lift
-        )
+        grasp_q_closed = set_gripper(grasp_q.copy(), _CLOSED_V)
+
+        segments = [
+            (home_q, pre_grasp_q, _MOVE_STEPS),      # Home -> Pre-grasp
+            (pre_grasp_q, grasp_q, _MOVE_STEPS),     # Pre-grasp -> Grasp
+            (grasp_q, grasp_q_closed, _CLOSE_STEPS), # Close Gripper
+            (grasp_q_closed, lift_q, _MOVE_STEPS),   # Grasp -> Lift
+        ]
+
+        # Write every segment straight into one (3*_MOVE_STEPS + _CLOSE_STEPS, D)
+        # trajectory allocated up front
+        full_trajectory = np.empty((3 * _MOVE_STEPS + _CLOSE_STEPS, len(home_q)), dtype=np.float64)
+        row = 0
+        for start_q, end_q, steps in segments:
+            self.interpolate(start_q, end_q, steps, out=full_trajectory[row:row + steps])
+            row += steps
 
         return full_trajectory
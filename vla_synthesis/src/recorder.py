@@ -1,110 +1,804 @@
-import h5py
 import numpy as np
 import os
+import queue
+import threading
+import warnings
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+# Imported by the first HDF5Recorder, so code that only uses EpisodeBuffer
+# does not load the HDF5 library
+h5py = None
+
+def _is_tensor(x):
+    """Whether `x` is a torch-like tensor, which may live on the GPU."""
+    return hasattr(x, 'detach') and hasattr(x, 'cpu')
+
+def _to_numpy(x):
+    """Copy a tensor to a host numpy array; other values pass through."""
+    if _is_tensor(x):
+        return x.detach().cpu().numpy()
+    return x
+
+@dataclass
+class EpisodeBuffer:
+    """
+    In-memory step storage for one episode, laid out as one pre-allocated
+    array per field. Arrays are allocated on the first step, once the
+    observation and action shapes are known, and grow by doubling if the
+    capacity is exceeded. They are kept across `clear`, so each flush
+    window is filled by index into the same memory and written as one
+    contiguous slice per field.
+    """
+    capacity: int
+    obs: Optional[np.ndarray] = None
+    act: Optional[np.ndarray] = None
+    rew: Optional[np.ndarray] = None
+    state: Optional[np.ndarray] = None
+    size: int = 0
+    # Whether any step since the last clear() had a state
+    has_state: bool = False
+
+    def append(self, observation, action, reward, state=None):
+        """Copy one step into the next free row."""
+        if self.obs is None or (self.size == 0 and (self.obs.shape[1:] != np.shape(observation)
+                                                    or self.act.shape[1:] != np.shape(action))):
+            self.obs = np.empty((self.capacity,) + np.shape(observation), dtype=np.uint8)
+            self.act = np.empty((self.capacity,) + np.shape(action), dtype=np.float32)
+            self.rew = np.empty(self.capacity, dtype=np.float32)
+        elif self.size == self.obs.shape[0]:
+            self._grow()
+
+        i = self.size
+        self.obs[i] = observation
+        self.act[i] = action
+        self.rew[i] = reward
+        if state is not None:
+            if not self.has_state:
+                # Earlier rows of this window had no state and read as zero
+                state_shape = (self.obs.shape[0],) + np.shape(state)
+                if self.state is None or self.state.shape != state_shape:
+                    self.state = np.zeros(state_shape, dtype=np.float32)
+                else:
+                    self.state[:i] = 0
+                self.has_state = True
+            self.state[i] = state
+        elif self.has_state:
+            self.state[i] = 0
+        self.size += 1
+
+    def _grow(self):
+        for name in ('obs', 'act', 'rew', 'state'):
+            arr = getattr(self, name)
+            if arr is not None:
+                grown = np.zeros((2 * arr.shape[0],) + arr.shape[1:], dtype=arr.dtype)
+                grown[:self.size] = arr[:self.size]
+                setattr(self, name, grown)
+
+    def clear(self):
+        """Mark the buffer empty, keeping its arrays for reuse."""
+        self.size = 0
+        self.has_state = False
 
 class HDF5Recorder:
-    def __init__(self, save_path):
+    # Raw observation chunks hold as many frames as fit in about 1 MiB, so
+    # a training read of one frame decompresses only that frame: a single
+    # frame per chunk at 480x640x3 (~900 KB), up to OBS_CHUNK_LEN frames
+    # for small images, which would otherwise inflate chunk metadata.
+    OBS_CHUNK_BYTES = 1 << 20
+    # Frames per flush, and per chunk of JPEG observations
+    OBS_CHUNK_LEN = 32
+    # Rows per chunk of the low-dimensional datasets. They are stored
+    # uncompressed and chunks are allocated whole, so both are capped at
+    # the expected episode length when it is known.
+    ACT_CHUNK_LEN = 256
+    REW_CHUNK_LEN = 1024
+    GZIP_LEVEL = 4
+    # Raw data chunk cache per dataset. Observation chunks hold up to
+    # OBS_CHUNK_BYTES, or one frame when a frame is larger (~6 MB at 1080p).
+    # The default 1 MiB cache cannot keep such a chunk, so a chunk left
+    # partially written by one flush would be re-read and decompressed by
+    # the next; 8 MiB keeps it cached for frames up to 1080p.
+    CHUNK_CACHE_BYTES = 8 << 20
+    CHUNK_CACHE_SLOTS = 10007
+    # Allocation increment of the in-memory file image
+    CORE_BLOCK_SIZE = 64 << 20
+    # Blosc-LZ4 level for 'blosc' observations. Bit-shuffle is used rather
+    # than byte-shuffle, which is a no-op on one-byte pixels.
+    BLOSC_LEVEL = 5
+    # Longest UTF-8 instruction, in bytes, for which the vocabulary is stored
+    # as a fixed-length string array; longer ones fall back to vlen strings
+    VOCAB_MAX_BYTES = 128
+
+    def __init__(self, save_path, max_steps=None, background=True, queue_size=64,
+                 observation_codec='raw', jpeg_quality=85, flush_every=OBS_CHUNK_LEN,
+                 compression='lzf', fs_page_size=1 << 20, quantize_range=None,
+                 in_memory=False, backing_store=True, mode='a'):
         """
         Initialize the HDF5 recorder.
 
+        Steps are buffered in memory per episode and written to disk in one
+        block per dataset, either by `flush_episode` or automatically every
+        `flush_every` steps. By default all file operations
+        run in order on a background writer thread, so `save_step` returns
+        as soon as the step is queued; call `sync` before reading `file`.
+
         Args:
             save_path (str): Path to the HDF5 file.
+            max_steps (int, optional): Expected maximum episode length. When
+                given, datasets are pre-allocated to this many rows so writes
+                never resize them; `close_episode` trims the unused tail.
+            background (bool): Write from a background thread.
+            queue_size (int): Maximum number of queued operations before
+                `save_step` blocks. The default holds two automatic flushes'
+                worth of steps (about 60 MB of 640x480 frames), so the
+                simulation keeps running while the writer compresses a chunk.
+            observation_codec (str): 'raw' stores frames as an (N, H, W, 3)
+                uint8 dataset, compressed with `compression`. 'jpeg' stores
+                each frame as a JPEG-encoded variable-length uint8 row (N,),
+                roughly an order of magnitude smaller; decode with
+                `cv2.imdecode` (BGR order).
+                Requires OpenCV.
+            jpeg_quality (int): JPEG quality used by the 'jpeg' codec.
+            flush_every (int, optional): Flush an episode once this many steps
+                are buffered. The default matches the observation chunk length,
+                so each flush fills whole chunks. None keeps every step in
+                memory until the episode is flushed or closed.
+            compression (str): Filter for 'raw' observations. 'lzf' (default)
+                and 'gzip' are built into h5py. 'blosc' uses Blosc-LZ4 with
+                bit-shuffle from hdf5plugin, which is several times faster;
+                the data is stored with HDF5 filter ID 32001, so readers must
+                `import hdf5plugin` as well. Falls back to 'lzf' with a warning
+                if hdf5plugin is not installed.
+            fs_page_size (int): File space page size, in bytes, used when the
+                file is created. Small metadata and datasets are aggregated
+                into pages of this size, so a reader fetches them in few
+                large reads.
+            quantize_range (dict, optional): Store 'actions' and/or 'states'
+                as uint16 fixed-point instead of float32, halving their size.
+                Maps the dataset name to its (low, high) bounds, scalars or
+                per-dimension arrays; values outside are clipped. Each
+                quantized dataset has 'scale' and 'offset' attributes, and
+                values are recovered as `q * scale + offset`. Steps without a
+                state decode to about 0.0, as they do unquantized.
+            in_memory (bool): Keep the whole file in memory with HDF5's core
+                driver and write it to `save_path` when an episode is closed
+                and on `close`, instead of issuing many small writes while
+                recording. Meant for small files such as one-episode shards,
+                since every flush writes the full file image.
+            backing_store (bool): With `in_memory`, whether the file is
+                written to `save_path` at all. False keeps it in memory only,
+                readable through `file` until `close` discards it, e.g. for
+                unit tests.
+            mode (str): 'a' (default) adds episodes to an existing file at
+                `save_path`; 'w' replaces it with a new file.
         """
+        global h5py
+        if h5py is None:
+            import h5py
+
+        if mode not in ('a', 'w'):
+            raise ValueError(f"Unknown file mode: {mode!r}")
+        if observation_codec not in ('raw', 'jpeg'):
+            raise ValueError(f"Unknown observation codec: {observation_codec!r}")
+        self._cv2 = None
+        if observation_codec == 'jpeg':
+            try:
+                import cv2
+            except ImportError:
+                raise ImportError("OpenCV is not installed. Please install it to use the 'jpeg' observation codec.")
+            self._cv2 = cv2
+        if compression not in ('lzf', 'gzip', 'blosc'):
+            raise ValueError(f"Unknown compression: {compression!r}")
+        self._obs_filter = {'compression': compression}
+        if compression == 'gzip':
+            self._obs_filter['compression_opts'] = self.GZIP_LEVEL
+        if compression == 'blosc':
+            try:
+                import hdf5plugin
+                self._obs_filter = dict(hdf5plugin.Blosc(
+                    cname='lz4', clevel=self.BLOSC_LEVEL, shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+            except ImportError:
+                warnings.warn("hdf5plugin is not installed. Falling back to LZF compression.")
+                compression = 'lzf'
+                self._obs_filter = {'compression': compression}
+        self._compress_chunk = self._chunk_compressor(compression)
+
+        # Dataset name -> (offset, scale) of the uint16 fixed-point encoding
+        self._quant = {}
+        for name, (low, high) in (quantize_range or {}).items():
+            if name not in ('actions', 'states'):
+                raise ValueError(f"Only 'actions' and 'states' can be quantized, not {name!r}")
+            low = np.asarray(low, dtype=np.float32)
+            high = np.asarray(high, dtype=np.float32)
+            if np.any(high <= low):
+                raise ValueError(f"Empty quantization range for {name!r}")
+            self._quant[name] = (low, (high - low) / np.float32(np.iinfo(np.uint16).max))
+        # Encoding of 0.0 per quantized dataset, used as its fill value so
+        # unwritten rows decode to zero like float32 ones. None when it
+        # differs between dimensions, as HDF5 fill values are scalars.
+        self._quant_fill = {}
+        for name in self._quant:
+            zero = np.unique(self._quantize(name, np.zeros(1, dtype=np.float32)))
+            self._quant_fill[name] = int(zero[0]) if len(zero) == 1 else None
+
         self.save_path = save_path
+        self.max_steps = max_steps
+        self.observation_codec = observation_codec
+        self.compression = compression
+        self.jpeg_quality = jpeg_quality
+        self.flush_every = flush_every
         # Ensure directory exists
         os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
-        self.file = h5py.File(save_path, 'a')
+        # libver='latest' enables the newer object header and chunk index
+        # formats, which make the per-flush resize cheaper. Paged aggregation
+        # with a persistent free-space manager can only be chosen at creation.
+        cache = dict(rdcc_nbytes=self.CHUNK_CACHE_BYTES, rdcc_nslots=self.CHUNK_CACHE_SLOTS)
+        if in_memory:
+            # The image grows in CORE_BLOCK_SIZE steps, so it is rarely reallocated
+            cache.update(driver='core', backing_store=backing_store, block_size=self.CORE_BLOCK_SIZE)
+        if mode == 'a' and os.path.exists(save_path):
+            self.file = h5py.File(save_path, 'a', libver='latest', **cache)
+        else:
+            self.file = h5py.File(save_path, 'w' if mode == 'w' else 'x', libver='latest',
+                                  fs_strategy='page', fs_persist=True, fs_page_size=fs_page_size,
+                                  **cache)
+        # EpisodeBuffer per open episode, plus one kept from the last closed
+        # episode so its arrays can be reused instead of reallocated
+        self._buffers = {}
+        self._spare_buffer = None
+        # Per-step write function of each open episode, specialized on its
+        # first step (see _make_step_writer)
+        self._step_writers = {}
+        # Number of rows already written to disk, per open episode
+        self._cursor = {}
+        # (group, {name: dataset}) of each open episode, so flushes do not
+        # look them up by name in the file
+        self._handles = {}
+        # Per-episode pre-allocation length, when it differs from max_steps
+        self._est_len = {}
+        # Instruction of each open episode. Only touched by the caller's
+        # thread, so instruction changes are reported by save_step itself.
+        self._instructions = {}
+        # Instruction vocabulary shared by all episodes in the file. Each
+        # episode stores the ID of its instruction, which indexes the
+        # 'instruction_vocab' file attribute. Also caller-thread only.
+        self._vocab = {}
+        if 'instruction_vocab' in self.file.attrs:
+            self._vocab = {
+                text.decode('utf-8') if isinstance(text, bytes) else str(text): i
+                for i, text in enumerate(self.file.attrs['instruction_vocab'])
+            }
+
+        self._error = None
+        self._queue = None
+        self._writer = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._drain, daemon=True)
+            self._writer.start()
+
+    def _submit(self, fn, *args):
+        """Run a file operation, on the writer thread if there is one."""
+        if self._queue is None:
+            fn(*args)
+            return
+        self._raise_writer_error()
+        self._queue.put((fn, args))
 
-    def create_episode_group(self, episode_idx):
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args = item
+                # After a failure, drop further work until the error is reported
+                if self._error is None:
+                    fn(*args)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _chunk_compressor(self, compression):
+        """
+        Return a function compressing one observation chunk exactly like the
+        dataset's HDF5 filter, or None if no Python binding is available.
         """
-        Create a group for the episode.
+        if compression == 'gzip':
+            return lambda chunk: zlib.compress(chunk, self.GZIP_LEVEL)
+        if compression == 'lzf':
+            try:
+                import lzf
+            except ImportError:
+                return None
+            # Leave room for LZF's worst-case expansion of incompressible frames
+            return lambda chunk: lzf.compress(chunk, chunk.nbytes + chunk.nbytes // 32 + 16)
+        try:
+            import blosc
+        except ImportError:
+            return None
+        return lambda chunk: blosc.compress(chunk, typesize=1, clevel=self.BLOSC_LEVEL,
+                                            shuffle=blosc.BITSHUFFLE, cname='lz4')
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            # Work queued behind the failed operation would build on its
+            # partial result, so let the writer discard all of it first
+            if self._queue is not None:
+                self._queue.join()
+            error, self._error = self._error, None
+            raise error
+
+    def sync(self):
+        """Block until all queued operations have been written to the file."""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_writer_error()
+
+    def _new_buffer(self):
+        buf, self._spare_buffer = self._spare_buffer, None
+        if buf is None:
+            buf = EpisodeBuffer(capacity=self.flush_every or self.max_steps or self.OBS_CHUNK_LEN)
+        buf.clear()
+        return buf
+
+    def register_instructions(self, instructions):
+        """
+        Add instructions to the vocabulary up front, so their IDs follow the
+        given order and are the same in every file that registers them.
+
+        Args:
+            instructions (iterable of str): Instructions to register.
+        """
+        size = len(self._vocab)
+        for instruction in instructions:
+            self._intern(instruction, write=False)
+        if len(self._vocab) != size:
+            self._submit(self._write_vocab, list(self._vocab))
+
+    def _intern(self, instruction, write=True):
+        """Return the vocabulary ID of an instruction, adding it if new."""
+        instruction_id = self._vocab.get(instruction)
+        if instruction_id is None:
+            instruction_id = len(self._vocab)
+            if instruction_id > np.iinfo(np.uint16).max:
+                raise ValueError("Instruction vocabulary exceeds 65536 entries")
+            self._vocab[instruction] = instruction_id
+            if write:
+                self._submit(self._write_vocab, list(self._vocab))
+        return instruction_id
+
+    def _write_vocab(self, vocab):
+        # Fixed-length strings are stored inline, without the per-entry heap
+        # objects of variable-length strings. Entries are null-padded to the
+        # longest one; numpy strips the padding on read.
+        encoded = [text.encode('utf-8') for text in vocab]
+        if max(map(len, encoded)) <= self.VOCAB_MAX_BYTES:
+            self.file.attrs['instruction_vocab'] = np.array(encoded, dtype=np.bytes_)
+        else:
+            self.file.attrs['instruction_vocab'] = np.array(vocab, dtype=h5py.string_dtype())
+
+    def _set_instruction(self, grp, instruction, instruction_id):
+        # Stored once per episode, as group attributes
+        grp.attrs['instruction'] = instruction
+        grp.attrs['instruction_id'] = np.uint16(instruction_id)
+
+    def create_episode_group(self, episode_idx, instruction=None, obs_shape=None,
+                             action_dim=None, state_dim=None, est_len=None):
+        """
+        Create a group for the episode, discarding any previous data for it.
+
+        Datasets are normally created on the first flush, once the step
+        shapes are known. Passing the shapes here creates them up front.
 
         Args:
             episode_idx (int): Index of the episode.
+            instruction (str, optional): Text instruction of the episode. If
+                omitted, it is taken from the first saved step.
+            obs_shape (tuple, optional): Observation shape (H, W, 3).
+            action_dim (int, optional): Action dimension.
+            state_dim (int, optional): State dimension.
+            est_len (int, optional): Expected length of this episode,
+                overriding `max_steps`. Datasets are pre-allocated to this
+                many rows and trimmed by `close_episode`.
         """
+        self._instructions.pop(episode_idx, None)
+        instruction_id = None
+        if instruction is not None:
+            self._instructions[episode_idx] = instruction
+            instruction_id = self._intern(instruction)
+        self._submit(self._create_episode_group, episode_idx, instruction, instruction_id,
+                     obs_shape, action_dim, state_dim, est_len)
+
+    def _create_episode_group(self, episode_idx, instruction, instruction_id=None, obs_shape=None,
+                              action_dim=None, state_dim=None, est_len=None):
         group_name = f'episode_{episode_idx}'
         if group_name in self.file:
             del self.file[group_name]
-        self.file.create_group(group_name)
+        # Like the datasets, groups get no modification times to rewrite
+        gcpl = h5py.h5p.create(h5py.h5p.GROUP_CREATE)
+        gcpl.set_obj_track_times(False)
+        grp = h5py.Group(h5py.h5g.create(self.file.id, group_name.encode(), gcpl=gcpl))
+        dsets = {}
+        self._handles[episode_idx] = (grp, dsets)
+        self._buffers[episode_idx] = self._new_buffer()
+        self._step_writers.pop(episode_idx, None)
+        self._cursor[episode_idx] = 0
+        if est_len is not None:
+            self._est_len[episode_idx] = est_len
+        else:
+            self._est_len.pop(episode_idx, None)
+        if instruction is not None:
+            self._set_instruction(grp, instruction, instruction_id)
+
+        if obs_shape is not None:
+            dsets['observations'] = self._create_dataset(grp, 'observations', tuple(obs_shape),
+                                                         est_len=est_len)
+        if action_dim is not None:
+            dsets['actions'] = self._create_dataset(grp, 'actions', (action_dim,), est_len=est_len)
+        if obs_shape is not None or action_dim is not None:
+            dsets['rewards'] = self._create_dataset(grp, 'rewards', (), est_len=est_len)
+        if state_dim is not None:
+            dsets['states'] = self._create_dataset(grp, 'states', (state_dim,), est_len=est_len)
+
+    def _episode_handles(self, episode_idx):
+        """Return the cached group and datasets of an episode, opening them if needed."""
+        handles = self._handles.get(episode_idx)
+        if handles is None:
+            # Episode continued from an existing file
+            grp = self.file[f'episode_{episode_idx}']
+            handles = self._handles[episode_idx] = (grp, dict(grp.items()))
+        return handles
+
+    def start_swmr(self):
+        """
+        Switch the file to single-writer/multiple-reader mode, so another
+        process can open it with `h5py.File(path, 'r', libver='latest',
+        swmr=True)` and read episodes while they are being recorded.
+        Every flush is then made visible to readers; they call `refresh()`
+        on a dataset to see its new rows.
 
-    def save_step(self, episode_idx, observation, action, instruction, reward, state=None):
+        HDF5 cannot add groups, datasets or attributes in SWMR mode, so the
+        episode must already be created with all its shapes through
+        `create_episode_group`, and every instruction registered beforehand.
+        Not available for in-memory files.
         """
-        Save a single step of data.
+        if self.file.driver == 'core':
+            raise ValueError("SWMR mode is not available for in-memory files")
+        self._submit(self._start_swmr)
+        self.sync()
+
+    def _start_swmr(self):
+        self.file.swmr_mode = True
+
+    def save_step(self, episode_idx, observation, action, instruction, reward, state=None,
+                  copy=True):
+        """
+        Buffer a single step of data.
 
         Args:
             episode_idx (int): Index of the episode.
-            observation (np.ndarray): RGB image (uint8).
+            observation (np.ndarray): RGB image (uint8). Torch tensors are
+                accepted and copied to the host when the step is buffered, on
+                the writer thread in background mode.
             action (np.ndarray): Joint positions/velocities (float32).
-            instruction (str): Text instruction.
+            instruction (str): Text instruction. It is stored once per
+                episode, with its vocabulary ID, and must not change between
+                steps.
             reward (float): Reward.
             state (np.ndarray, optional): Robot end-effector pose.
+            copy (bool): In background mode, copy the inputs before queuing
+                them so the caller may reuse its arrays. Pass False if they
+                are not modified after the call; the step is then copied only
+                once, into the episode buffer. Ignored in foreground mode,
+                which never copies on queuing.
         """
-        group_name = f'episode_{episode_idx}'
-        if group_name not in self.file:
-            self.create_episode_group(episode_idx)
+        current = self._instructions.get(episode_idx)
+        if current is None:
+            self._instructions[episode_idx] = instruction
+        elif instruction != current:
+            raise ValueError(
+                f"Instruction changed within episode {episode_idx}: {current!r} -> {instruction!r}"
+            )
+        new_instruction = None
+        if current is None:
+            new_instruction = (instruction, self._intern(instruction))
 
-        grp = self.file[group_name]
+        if self._queue is not None and copy:
+            # The caller may reuse its arrays once we return, so queue copies
+            # (converted to the stored dtypes in the same pass). Tensors are
+            # cloned on their device; the host copy happens on the writer.
+            observation = self._snapshot(observation, np.uint8)
+            action = self._snapshot(action, np.float32)
+            if state is not None:
+                state = self._snapshot(state, np.float32)
 
-        # Ensure correct types
-        if observation.dtype != np.uint8:
-            observation = observation.astype(np.uint8)
+        self._submit(self._save_step, episode_idx, observation, action, reward, state, new_instruction)
 
-        if action.dtype != np.float32:
-            action = action.astype(np.float32)
+    @staticmethod
+    def _snapshot(x, dtype):
+        if _is_tensor(x):
+            return x.detach().clone()
+        return np.array(x, dtype=dtype)
 
-        # Initialize datasets if they don't exist
-        if 'observations' not in grp:
-            # Observation: (N, H, W, 3)
-            obs_shape = (0,) + observation.shape
-            max_obs_shape = (None,) + observation.shape
-            grp.create_dataset('observations', shape=obs_shape, maxshape=max_obs_shape, dtype='uint8', compression='gzip')
+    def _save_step(self, episode_idx, observation, action, reward, state, new_instruction):
+        write_step = self._step_writers.get(episode_idx)
+        if write_step is None:
+            buf = self._buffers.get(episode_idx)
+            if buf is None:
+                group_name = f'episode_{episode_idx}'
+                if group_name not in self.file:
+                    self._create_episode_group(episode_idx, None)
+                buf = self._buffers.setdefault(episode_idx, self._new_buffer())
+            write_step = self._make_step_writer(episode_idx, buf, observation)
+            self._step_writers[episode_idx] = write_step
+        if new_instruction is not None:
+            self._set_instruction(self._episode_handles(episode_idx)[0], *new_instruction)
 
-            # Action: (N, D)
-            act_shape = (0,) + action.shape
-            max_act_shape = (None,) + action.shape
-            grp.create_dataset('actions', shape=act_shape, maxshape=max_act_shape, dtype='float32')
+        write_step(observation, action, reward, state)
 
-            # Instruction: (N,)
-            dt = h5py.special_dtype(vlen=str)
-            grp.create_dataset('instructions', shape=(0,), maxshape=(None,), dtype=dt)
+    def _make_step_writer(self, episode_idx, buf, observation):
+        """
+        Build the per-step write function of an episode from its first step.
 
-            # Reward: (N,)
-            grp.create_dataset('rewards', shape=(0,), maxshape=(None,), dtype='float32')
+        The episode's buffer, flush threshold and input conversion are bound
+        once, so later steps skip the buffer lookup and per-value type checks.
+        Whether steps arrive as tensors is decided by the first observation.
+        """
+        append = buf.append
+        flush_every = self.flush_every
+        flush = self._flush_episode
 
-            # State (optional): (N, D_state)
-            if state is not None:
-                state_shape = (0,) + state.shape
-                max_state_shape = (None,) + state.shape
-                grp.create_dataset('states', shape=state_shape, maxshape=max_state_shape, dtype='float32')
+        if _is_tensor(observation):
+            def write_step(observation, action, reward, state):
+                append(_to_numpy(observation), _to_numpy(action), reward, _to_numpy(state))
+                if flush_every and buf.size >= flush_every:
+                    flush(episode_idx)
+        else:
+            def write_step(observation, action, reward, state):
+                # Rows are uint8 / float32, so values are converted on copy
+                append(observation, action, reward, state)
+                if flush_every and buf.size >= flush_every:
+                    flush(episode_idx)
+        return write_step
+
+    def flush_episode(self, episode_idx):
+        """
+        Write all buffered steps of an episode to the file.
 
-        # Append data by resizing
-        n = grp['observations'].shape[0]
+        Each dataset is created on first flush and extended by a single block
+        write per call, instead of one resize and write per step.
 
-        grp['observations'].resize((n + 1,) + observation.shape)
-        grp['observations'][n] = observation
+        Args:
+            episode_idx (int): Index of the episode.
+        """
+        self._submit(self._flush_episode, episode_idx)
 
-        grp['actions'].resize((n + 1,) + action.shape)
-        grp['actions'][n] = action
+    def _flush_episode(self, episode_idx):
+        buf = self._buffers.get(episode_idx)
+        if buf is None or buf.size == 0:
+            return
 
-        grp['instructions'].resize((n + 1,))
-        grp['instructions'][n] = instruction
+        grp, dsets = self._episode_handles(episode_idx)
+        if episode_idx not in self._cursor:
+            self._cursor[episode_idx] = dsets['observations'].shape[0] if 'observations' in dsets else 0
+        n = self._cursor[episode_idx]
+        k = buf.size
+        est_len = self._est_len.get(episode_idx)
 
-        grp['rewards'].resize((n + 1,))
-        grp['rewards'][n] = reward
+        # Observation: (N, H, W, 3), or (N,) JPEG rows
+        if self.observation_codec == 'jpeg':
+            self._append(grp, dsets, 'observations', self._encode_jpeg(buf.obs[:k]), n, est_len)
+        else:
+            self._append(grp, dsets, 'observations', buf.obs[:k], n, est_len)
 
-        if state is not None:
-            if 'states' not in grp:
-                 # If state appears late, create the dataset now
-                 state_shape = (0,) + state.shape
-                 max_state_shape = (None,) + state.shape
-                 grp.create_dataset('states', shape=state_shape, maxshape=max_state_shape, dtype='float32')
+        # Action: (N, D)
+        self._append(grp, dsets, 'actions', self._quantize('actions', buf.act[:k]), n, est_len)
+
+        # Reward: (N,)
+        self._append(grp, dsets, 'rewards', buf.rew[:k], n, est_len)
+
+        # State (optional): (N, D_state). Only created once a state arrives;
+        # episodes without any state have no 'states' dataset. Blocks without
+        # a state are not written at all: those rows read back as the
+        # dataset's zero fill value once the dataset is extended past them.
+        # Per-dimension quantization ranges have no single fill value, so
+        # their zero rows are written out instead.
+        write_zeros = 'states' in self._quant and self._quant_fill['states'] is None
+        if buf.has_state:
+            if write_zeros and 'states' not in dsets and n:
+                self._append(grp, dsets, 'states',
+                             self._quantized_zeros('states', n, buf.state.shape[1:]), 0, est_len)
+            self._append(grp, dsets, 'states', self._quantize('states', buf.state[:k]), n, est_len)
+        elif write_zeros and 'states' in dsets:
+            self._append(grp, dsets, 'states',
+                         self._quantized_zeros('states', k, dsets['states'].shape[1:]), n, est_len)
+
+        self._cursor[episode_idx] = n + k
+        buf.clear()
+        if self.file.swmr_mode:
+            # SWMR readers only see rows that have been flushed to the file
+            self.file.flush()
+
+    def _quantize(self, name, block):
+        """Encode a float block as uint16 fixed-point if `name` is quantized."""
+        if name not in self._quant:
+            return block
+        offset, scale = self._quant[name]
+        q = np.rint((block - offset) / scale)
+        np.clip(q, 0, np.iinfo(np.uint16).max, out=q)
+        return q.astype(np.uint16)
+
+    def _quantized_zeros(self, name, rows, elt_shape):
+        """Return `rows` encoded zero rows of the quantized dataset `name`."""
+        return self._quantize(name, np.zeros((rows,) + tuple(elt_shape), dtype=np.float32))
+
+    def _encode_jpeg(self, frames):
+        """Encode RGB frames to an object array of JPEG byte arrays."""
+        cv2 = self._cv2
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        encoded = np.empty(len(frames), dtype=object)
+        for i, frame in enumerate(frames):
+            ok, data = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), params)
+            if not ok:
+                raise RuntimeError("JPEG encoding of observation failed")
+            encoded[i] = data.reshape(-1)
+        return encoded
+
+    def close_episode(self, episode_idx):
+        """
+        Flush an episode and trim its pre-allocated datasets to the number
+        of recorded steps.
+
+        Args:
+            episode_idx (int): Index of the episode.
+        """
+        self._instructions.pop(episode_idx, None)
+        self._submit(self._close_episode, episode_idx)
+
+    def _close_episode(self, episode_idx):
+        self._flush_episode(episode_idx)
+        self._step_writers.pop(episode_idx, None)
+        buf = self._buffers.pop(episode_idx, None)
+        if buf is not None:
+            self._spare_buffer = buf
+        self._est_len.pop(episode_idx, None)
+        handles = self._handles.pop(episode_idx, None)
+        length = self._cursor.pop(episode_idx, None)
+        if length is None:
+            return
+
+        _, dsets = handles or self._episode_handles(episode_idx)
+        for dset in dsets.values():
+            if dset.shape[0] != length:
+                dset.resize((length,) + dset.shape[1:])
+        if self.file.driver == 'core':
+            # Episode boundaries are the only points an in-memory file is saved
+            self.file.flush()
+
+    def _create_dataset(self, grp, name, elt_shape, rows=0, est_len=None):
+        """
+        Create an episode dataset with its chunk shape and filters, sized to
+        at least `rows` and the expected episode length.
+
+        Raw observations use the configured compression filter. The
+        remaining datasets are too small to benefit from any codec and are
+        stored uncompressed; when pre-allocated, their chunks are allocated
+        at creation so they are laid out together on disk.
+        """
+        est_len = est_len or self.max_steps
+        rows = max(est_len or 0, rows)
+        dcpl = None
+        if name == 'observations' and self.observation_codec == 'jpeg':
+            elt_shape = ()
+            kwargs = dict(dtype=h5py.vlen_dtype(np.uint8), chunks=(self.OBS_CHUNK_LEN,))
+        elif name == 'observations':
+            frame_bytes = int(np.prod(elt_shape))
+            chunk_len = min(max(self.OBS_CHUNK_BYTES // max(frame_bytes, 1), 1), self.OBS_CHUNK_LEN)
+            kwargs = dict(dtype=np.uint8, chunks=(chunk_len,) + elt_shape, **self._obs_filter)
+        else:
+            chunk_len = self.REW_CHUNK_LEN if name == 'rewards' else self.ACT_CHUNK_LEN
+            if est_len:
+                chunk_len = min(chunk_len, est_len)
+                dcpl = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+                dcpl.set_alloc_time(h5py.h5d.ALLOC_TIME_EARLY)
+            kwargs = dict(dtype=np.float32, chunks=(chunk_len,) + elt_shape)
+            if name in self._quant:
+                kwargs.update(dtype=np.uint16, fillvalue=self._quant_fill[name])
+
+        # Modification times would be rewritten on every resize
+        dset = grp.create_dataset(name, shape=(rows,) + elt_shape, maxshape=(None,) + elt_shape,
+                                  dcpl=dcpl, track_times=False, **kwargs)
+        if name == 'observations' and self.observation_codec == 'jpeg':
+            dset.attrs['codec'] = 'jpeg'
+        if name in self._quant:
+            offset, scale = self._quant[name]
+            dset.attrs['offset'] = offset
+            dset.attrs['scale'] = scale
+        return dset
+
+    def _append(self, grp, dsets, name, block, offset, est_len=None):
+        """Write `block` at row `offset`, creating the dataset on first use."""
+        elt_shape = block.shape[1:]
+        end = offset + len(block)
+        dset = dsets.get(name)
+        if dset is None:
+            dset = dsets[name] = self._create_dataset(grp, name, elt_shape, end, est_len)
+        if dset.shape[0] < end:
+            dset.resize((end,) + elt_shape)
+        if name == 'observations' and self._compress_chunk is not None and block.dtype != object:
+            self._write_chunks(dset, block, offset)
+        elif block.dtype == object:
+            # Variable-length rows of equal size would be broadcast as a 2-D
+            # array by h5py, so write them one at a time
+            for i, row in enumerate(block):
+                dset[offset + i] = row
+        else:
+            # write_direct hands the hyperslab straight to H5Dwrite, skipping
+            # h5py's fancy-indexing path and its temporary selection objects
+            dset.write_direct(np.ascontiguousarray(block), dest_sel=np.s_[offset:end])
 
-            grp['states'].resize((n + 1,) + state.shape)
-            grp['states'][n] = state
+    def _write_chunks(self, dset, block, offset):
+        """
+        Write `block` at row `offset`, compressing every whole chunk it covers
+        here and storing it with write_direct_chunk, which bypasses HDF5's
+        selection and filter pipeline. Rows outside whole chunks take the
+        regular write path.
+        """
+        chunk_len = dset.chunks[0]
+        end = offset + len(block)
+        # Rows [start, stop) are covered by whole, aligned chunks
+        start = -(-offset // chunk_len) * chunk_len
+        stop = start + max(end - start, 0) // chunk_len * chunk_len
+        if stop == start:
+            dset.write_direct(np.ascontiguousarray(block), dest_sel=np.s_[offset:end])
+            return
+
+        if offset < start:
+            dset.write_direct(np.ascontiguousarray(block[:start - offset]),
+                              dest_sel=np.s_[offset:start])
+        chunk_offset = (0,) * (dset.ndim - 1)
+        for row in range(start, stop, chunk_len):
+            chunk = np.ascontiguousarray(block[row - offset:row - offset + chunk_len])
+            dset.id.write_direct_chunk((row,) + chunk_offset, self._compress_chunk(chunk))
+        if stop < end:
+            dset.write_direct(np.ascontiguousarray(block[stop - offset:]),
+                              dest_sel=np.s_[stop:end])
+
+    def flush(self):
+        """
+        Write the buffered steps of all open episodes and wait for them to
+        reach the file, so it can be read while recording continues.
+        """
+        self._submit(self._flush_all_episodes)
+        self.sync()
+
+    def _flush_all_episodes(self):
+        for episode_idx in list(self._buffers):
+            self._flush_episode(episode_idx)
+        self.file.flush()
+
+    def _close_all_episodes(self):
+        for episode_idx in set(self._buffers) | set(self._cursor):
+            self._close_episode(episode_idx)
 
     def close(self):
-        """Close the HDF5 file."""
-        if self.file:
+        """Close any open episodes, stop the writer thread and close the HDF5 file."""
+        if not self.file:
+            return
+        self._instructions.clear()
+        try:
+            self._submit(self._close_all_episodes)
+            self.sync()
+        finally:
+            if self._writer is not None:
+                self._queue.put(None)
+                self._writer.join()
+                self._writer = None
+                self._queue = None
             self.file.close()
             self.file = None
 
@@ -113,6 +807,3 @@ class HDF5Recorder:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
-
-    def __del__(self):
-        self.close()
@@ -2,10 +2,10 @@ import numpy as np
 import warnings
 from typing import Tuple, Optional
 
-try:
-    import genesis as gs
-except ImportError:
-    gs = None
+from .utils import get_genesis
+
+# Set by the first SceneManager (see utils.get_genesis)
+gs = None
 
 class SceneManager:
     """
@@ -13,7 +13,15 @@ class SceneManager:
     Handles robot loading, camera setup with domain randomization, lighting, and rendering.
     Implements Phase 1: Environment & Scene Manager Setup.
     """
-    def __init__(self, debug: bool = False):
+    # Half-widths of the uniform camera noise: position (xyz), then look-at (xyz)
+    CAMERA_NOISE = np.array([0.05, 0.05, 0.05, 0.02, 0.02, 0.02])
+    # Light position (xyz) and intensity bounds
+    LIGHT_LOW = np.array([1.0, 1.0, 2.0, 2.0])
+    LIGHT_HIGH = np.array([3.0, 3.0, 4.0, 5.0])
+
+    def __init__(self, debug: bool = False, seed: Optional[int] = None):
+        global gs
+        gs = get_genesis()
         if gs is None:
             raise ImportError("Genesis library is not installed. Please install it to use SceneManager.")
 
@@ -24,6 +32,23 @@ class SceneManager:
         self.camera = None
         self.light = None
         self.render_res = (640, 480)
+        # Whether camera.render() can return all images from one pass;
+        # probed on the first render
+        self._fused_render = None
+        # Read-only zero images substituted for missing render outputs,
+        # allocated on first use
+        self._zero_images = None
+        # Source of all domain randomization, so resets are reproducible
+        self.rng = np.random.default_rng(seed)
+
+    def seed(self, seed: Optional[int]) -> None:
+        """
+        Re-seed the domain randomization.
+
+        Args:
+            seed (int, optional): Seed for the random generator.
+        """
+        self.rng = np.random.default_rng(seed)
 
     def load_robot(self) -> None:
         """
@@ -68,12 +93,10 @@ class SceneManager:
         base_pos = np.array([1.0, 0.0, 0.8])
         look_at_target = np.array([0.5, 0.0, 0.0])
 
-        # Domain randomization: Add small random perturbations
-        pos_noise = np.random.uniform(-0.05, 0.05, size=3)
-        cam_pos = base_pos + pos_noise
-
-        target_noise = np.random.uniform(-0.02, 0.02, size=3)
-        look_at = look_at_target + target_noise
+        # Domain randomization: Add small random perturbations, drawn at once
+        noise = self.rng.uniform(-self.CAMERA_NOISE, self.CAMERA_NOISE)
+        cam_pos = base_pos + noise[:3]
+        look_at = look_at_target + noise[3:]
 
         if self.camera is None:
             self.camera = self.scene.add_camera(
@@ -95,10 +118,10 @@ class SceneManager:
         """
         Randomize light position and intensity.
         """
-        # Random position
-        light_pos = np.random.uniform(low=[1.0, 1.0, 2.0], high=[3.0, 3.0, 4.0])
-        # Random intensity
-        intensity = np.random.uniform(2.0, 5.0)
+        # Random position and intensity in a single draw
+        light = self.rng.uniform(self.LIGHT_LOW, self.LIGHT_HIGH)
+        light_pos = light[:3]
+        intensity = float(light[3])
 
         if self.light is None:
             self.light = self.scene.add_entity(
@@ -120,35 +143,69 @@ class SceneManager:
         """
         self.scene.step()
 
-    def render(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def render(self, to_numpy: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Render the scene.
 
+        Args:
+            to_numpy (bool): Copy the images to host numpy arrays. When False,
+                the camera's tensors are returned as is (possibly on the GPU),
+                leaving the device-to-host copy to the consumer, e.g. the
+                recorder's writer thread. Only applies to cameras without
+                fused rendering, whose images come back as numpy arrays.
+
         Returns:
-            tuple: (rgb, depth, segmentation_mask)
+            tuple: (rgb, depth, segmentation_mask). Missing images are shared,
+                read-only zero arrays; copy them before modifying.
         """
-        width, height = self.render_res
-
-        # Initialize zero arrays for fallback
-        zero_rgb = np.zeros((height, width, 3), dtype=np.uint8)
-        zero_depth = np.zeros((height, width), dtype=np.float32)
-        zero_seg = np.zeros((height, width), dtype=np.int32)
-
         if self.camera is None:
-            return zero_rgb, zero_depth, zero_seg
+            return self._get_zero_images()
+
+        if self._fused_render is not False:
+            # Genesis cameras return (rgb, depth, segmentation, normal) from a
+            # single render pass, avoiding three separate retrievals
+            try:
+                images = self.camera.render(rgb=True, depth=True, segmentation=True)
+            except TypeError:
+                images = None
+            self._fused_render = isinstance(images, (tuple, list)) and len(images) >= 3
+            if self._fused_render:
+                return self._fill_missing(*images[:3])
 
         self.camera.render()
 
         # Retrieve data from camera
-        rgb = self.camera.get_color(return_numpy=True) if hasattr(self.camera, 'get_color') else None
-        depth = self.camera.get_depth(return_numpy=True) if hasattr(self.camera, 'get_depth') else None
-        seg = self.camera.get_segmentation(return_numpy=True) if hasattr(self.camera, 'get_segmentation') else None
-
-        return (
-            rgb if rgb is not None else zero_rgb,
-            depth if depth is not None else zero_depth,
-            seg if seg is not None else zero_seg
-        )
+        rgb = self.camera.get_color(return_numpy=to_numpy) if hasattr(self.camera, 'get_color') else None
+        depth = self.camera.get_depth(return_numpy=to_numpy) if hasattr(self.camera, 'get_depth') else None
+        seg = self.camera.get_segmentation(return_numpy=to_numpy) if hasattr(self.camera, 'get_segmentation') else None
+
+        return self._fill_missing(rgb, depth, seg)
+
+    def _get_zero_images(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return read-only zero (rgb, depth, segmentation) images at the current
+        render resolution, reallocating only if the resolution changed.
+        """
+        width, height = self.render_res
+        if self._zero_images is None or self._zero_images[1].shape != (height, width):
+            zeros = (
+                np.zeros((height, width, 3), dtype=np.uint8),
+                np.zeros((height, width), dtype=np.float32),
+                np.zeros((height, width), dtype=np.int32)
+            )
+            for image in zeros:
+                image.setflags(write=False)
+            self._zero_images = zeros
+        return self._zero_images
+
+    def _fill_missing(self, rgb, depth, seg):
+        """Substitute zero images for render outputs that are None."""
+        if rgb is None or depth is None or seg is None:
+            zero_rgb, zero_depth, zero_seg = self._get_zero_images()
+            rgb = zero_rgb if rgb is None else rgb
+            depth = zero_depth if depth is None else depth
+            seg = zero_seg if seg is None else seg
+        return rgb, depth, seg
 
     def reset(self) -> None:
         """
@@ -1,30 +1,42 @@
 import numpy as np
-import random
 
-# Try importing genesis, if not available, it will be mocked in tests or fail if not installed in production
-try:
-    import genesis as gs
-except ImportError:
-    gs = None
+from .utils import get_genesis
+
+# Set by the first reset_task (see utils.get_genesis); Genesis is mocked in
+# tests and required in production
+gs = None
 
 class TaskGenerator:
-    def __init__(self):
+    # Templates: "Pick up the {color} {object}", "Grasp the {color} item", "Move the {object}"
+    TEMPLATES = (
+        "Pick up the {color} {object}",
+        "Grasp the {color} item",
+        "Move the {object}",
+        "Retrieve the {color} {object}"
+    )
+    # Spawn area: x in [0.3, 0.7], y in [-0.2, 0.2]
+    XY_LOW = np.array([0.3, -0.2])
+    XY_HIGH = np.array([0.7, 0.2])
+
+    # Define ASSET_DB with lambdas to create primitives
+    # Using lambdas allows deferred creation and parameterization
+    # We assume gs.morphs has Box, Sphere, Cylinder and they accept pos and color
+    ASSET_DB = {
+        "cube": lambda pos, color: gs.morphs.Box(pos=pos, size=(0.04, 0.04, 0.04), color=color),
+        "sphere": lambda pos, color: gs.morphs.Sphere(pos=pos, radius=0.03, color=color),
+        "mug": lambda pos, color: gs.morphs.Cylinder(pos=pos, height=0.08, radius=0.04, color=color) # Placeholder
+    }
+
+    def __init__(self, seed=None):
+        """
+        Args:
+            seed (int, optional): Seed for object, color, template and
+                position sampling.
+        """
         self.current_object = None
         self.instruction = ""
         self.target_object_entity = None
 
-        # Define ASSET_DB with lambdas to create primitives
-        # Using lambdas allows deferred creation and parameterization
-        # We assume gs.morphs has Box, Sphere, Cylinder and they accept pos and color
-        if gs:
-            self.ASSET_DB = {
-                "cube": lambda pos, color: gs.morphs.Box(pos=pos, size=(0.04, 0.04, 0.04), color=color),
-                "sphere": lambda pos, color: gs.morphs.Sphere(pos=pos, radius=0.03, color=color),
-                "mug": lambda pos, color: gs.morphs.Cylinder(pos=pos, height=0.08, radius=0.04, color=color) # Placeholder
-            }
-        else:
-            self.ASSET_DB = {}
-
         self.COLOR_DB = {
             "red": (1.0, 0.0, 0.0),
             "green": (0.0, 1.0, 0.0),
@@ -33,9 +45,32 @@ class TaskGenerator:
             "cyan": (0.0, 1.0, 1.0),
             "magenta": (1.0, 0.0, 1.0),
             "white": (1.0, 1.0, 1.0),
-            "black": (0.0, 0.0, 0.0)
+            # Not black: some renderers treat an all-zero color as unset
+            "gray": (0.5, 0.5, 0.5)
         }
 
+        # Key tuples are built once; reset_task only indexes them
+        self._asset_keys = tuple(self.ASSET_DB)
+        self._color_keys = tuple(self.COLOR_DB)
+        self._choices = np.array([len(self._asset_keys), len(self._color_keys), len(self.TEMPLATES)])
+        # Every instruction, formatted once and indexed by (object, color, template)
+        self._instruction_lut = np.empty(self._choices, dtype=object)
+        for obj_i, obj_name in enumerate(self._asset_keys):
+            for color_i, color_name in enumerate(self._color_keys):
+                for template_i, template in enumerate(self.TEMPLATES):
+                    self._instruction_lut[obj_i, color_i, template_i] = template.format(
+                        color=color_name, object=obj_name)
+        self.rng = np.random.default_rng(seed)
+
+    def seed(self, seed):
+        """
+        Re-seed task sampling.
+
+        Args:
+            seed (int, optional): Seed for the random generator.
+        """
+        self.rng = np.random.default_rng(seed)
+
     def reset_task(self, scene):
         """
         Reset the task: clear previous objects, spawn a new random object, and generate instruction.
@@ -43,6 +78,8 @@ class TaskGenerator:
         Args:
             scene: The genesis scene object.
         """
+        global gs
+        gs = get_genesis()
         if gs is None:
              raise ImportError("Genesis library is not installed. Please install it to use TaskGenerator.")
 
@@ -62,18 +99,17 @@ class TaskGenerator:
         self.target_object_entity = None
         self.instruction = ""
 
-        # Randomly select object and color
-        obj_name = random.choice(list(self.ASSET_DB.keys()))
-        color_name = random.choice(list(self.COLOR_DB.keys()))
+        # Randomly select object, color and template in one draw
+        obj_i, color_i, template_i = self.rng.integers(self._choices)
+        obj_name = self._asset_keys[obj_i]
+        color_name = self._color_keys[color_i]
         color_rgb = self.COLOR_DB[color_name]
 
         # Randomize position
-        # x in [0.3, 0.7], y in [-0.2, 0.2]
         # z should be slightly above table to avoid collision/penetration
-        x = random.uniform(0.3, 0.7)
-        y = random.uniform(-0.2, 0.2)
+        x, y = self.rng.uniform(self.XY_LOW, self.XY_HIGH)
         z = 0.05
-        pos = (x, y, z)
+        pos = (float(x), float(y), z)
 
         # Create the object primitive
         # Retrieve the lambda and call it
@@ -88,25 +124,21 @@ class TaskGenerator:
         self.target_object_entity = scene.add_entity(morph)
 
         # Generate instruction
-        # Templates: "Pick up the {color} {object}", "Grasp the {color} item", "Move the {object}"
-        templates = [
-            "Pick up the {color} {object}",
-            "Grasp the {color} item",
-            "Move the {object}",
-            "Retrieve the {color} {object}"
-        ]
-        template = random.choice(templates)
-
-        # Format the instruction
-        try:
-            # Handle cases where {color} might be missing in template (e.g. "Move the {object}")
-            self.instruction = template.format(color=color_name, object=obj_name)
-        except KeyError:
-            # Should not happen with current templates but good for safety
-            self.instruction = template.replace("{object}", obj_name).replace("{color}", color_name)
+        self.instruction = self._instruction_lut[obj_i, color_i, template_i]
 
         return self.instruction, self.target_object_entity
 
+    def instruction_vocabulary(self):
+        """
+        List every instruction reset_task can generate, in a fixed order.
+
+        Returns:
+            list: Unique instruction strings.
+        """
+        # Templates without {color} or {object} repeat across the table
+        vocab = dict.fromkeys(self._instruction_lut.transpose(2, 0, 1).ravel())
+        return list(vocab)
+
     def get_instruction(self):
         """
         Get the current task instruction and target object.
@@ -0,0 +1,54 @@
+import importlib
+
+def lazy_import(name):
+    """
+    Import an optional dependency at its first use instead of at module load.
+
+    Args:
+        name (str): Module name, e.g. 'genesis'.
+
+    Returns:
+        module: The imported module, or None if it is not installed.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+# Cached result of get_genesis, including None if Genesis is not installed
+_UNSET = object()
+_genesis = _UNSET
+
+def get_genesis():
+    """
+    Import Genesis on first use. Loading it initializes GPU drivers, so the
+    modules that need it call this when first used instead of at import.
+
+    Returns:
+        module: The genesis module, or None if it is not installed. Either
+            result is cached, so a missing install is not retried per call.
+    """
+    global _genesis
+    if _genesis is _UNSET:
+        _genesis = lazy_import('genesis')
+    return _genesis
+
+def find_method(obj, names):
+    """
+    Return the first of the named methods that `obj` provides, or None.
+
+    Used to resolve API differences between Genesis versions once, instead
+    of probing with hasattr on every step.
+
+    Args:
+        obj: Object to look the methods up on, e.g. a robot entity.
+        names (tuple of str): Method names, in order of preference.
+
+    Returns:
+        callable: The bound method, or None if `obj` has none of them.
+    """
+    for name in names:
+        fn = getattr(obj, name, None)
+        if fn is not None:
+            return fn
+    return None
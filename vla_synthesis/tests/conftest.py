@@ -0,0 +1,16 @@
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+# Genesis needs a GPU, so the whole suite shares one mock of it. It is
+# installed when this file is imported, before the test modules are
+# collected and import genesis themselves.
+if 'genesis' not in sys.modules:
+    sys.modules['genesis'] = MagicMock()
+
+@pytest.fixture(scope='session', autouse=True)
+def mock_genesis():
+    """The shared Genesis mock, removed from sys.modules after the session."""
+    yield sys.modules['genesis']
+    sys.modules.pop('genesis', None)
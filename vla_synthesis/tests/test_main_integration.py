@@ -1,12 +1,11 @@
 import unittest
 from unittest.mock import MagicMock, patch
+import subprocess
 import sys
 import os
+from types import SimpleNamespace
 import numpy as np
-
-# Mock genesis before importing anything else
-if 'genesis' not in sys.modules:
-    sys.modules['genesis'] = MagicMock()
+import pytest
 
 # Ensure project root is in path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -14,16 +13,21 @@ project_root = os.path.dirname(os.path.dirname(current_dir))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-# Also ensure vla_synthesis/src is in path for main_generate internal imports if needed
-# (main_generate handles its own imports but for test imports we need consistency)
-
-from vla_synthesis.src.scene_manager import SceneManager
-from vla_synthesis.src.task_generator import TaskGenerator
-from vla_synthesis.src.planner import SimplePlanner
 from vla_synthesis.src.recorder import HDF5Recorder
 import vla_synthesis.main_generate as main_gen
 
+# Camera images with the dtypes Genesis returns, shared by all tests
+_RGB = np.zeros((480, 640, 3), np.uint8)
+_DEPTH = np.zeros((480, 640), np.float32)
+_SEG = np.zeros((480, 640), np.int32)
+_TARGET_POS = np.array([0.5, 0.0, 0.05])
+
+@pytest.mark.integration
 class TestMainIntegration(unittest.TestCase):
+    @pytest.fixture(autouse=True)
+    def _tmp_path(self, tmp_path):
+        self.tmp_path = tmp_path
+
     @patch('vla_synthesis.main_generate.SceneManager')
     @patch('vla_synthesis.main_generate.TaskGenerator')
     @patch('vla_synthesis.main_generate.SimplePlanner')
@@ -33,30 +37,26 @@ class TestMainIntegration(unittest.TestCase):
         scene_instance = MockSceneManager.return_value
         task_gen_instance = MockTaskGen.return_value
         planner_instance = MockPlanner.return_value
-        recorder_instance = MockRecorder.return_value
+        recorder_instance = MockRecorder.return_value.__enter__.return_value
 
         # Mock TaskGenerator behavior
-        mock_target_obj = MagicMock()
-        mock_target_obj.get_pos.return_value = np.array([0.5, 0.0, 0.05])
-        task_gen_instance.reset_task.return_value = ("Pick up the cube", mock_target_obj)
+        # Only read, never asserted on, so a plain stub is enough
+        target_obj = SimpleNamespace(get_pos=lambda: _TARGET_POS)
+        task_gen_instance.reset_task.return_value = ("Pick up the cube", target_obj)
 
         # Mock Planner behavior
         # Return a dummy trajectory of 10 steps
-        dummy_traj = [np.zeros(9) for _ in range(10)]
+        dummy_traj = np.zeros((10, 9))
         planner_instance.plan_grasp.return_value = dummy_traj
 
         # Mock SceneManager render
-        scene_instance.render.return_value = (np.zeros((480, 640, 3)), np.zeros((480, 640)), np.zeros((480, 640)))
+        scene_instance.render.return_value = (_RGB, _DEPTH, _SEG)
 
         # Mock robot control
         scene_instance.robot.control_dofs_position = MagicMock()
 
-        # Run main with reduced episodes for speed
-        # Check if we can patch global variable or just run it and break early?
-        # Since main() hardcodes NUM_EPISODES = 1000, we can't easily change it without modifying code.
-        # But we can mock range to return a short list.
-        with patch('builtins.range', return_value=[0]):
-            main_gen.main()
+        # Run main with a single episode for speed
+        main_gen.main(num_episodes=1)
 
         # Assertions
         # 1. Check Initialization
@@ -64,26 +64,96 @@ class TestMainIntegration(unittest.TestCase):
         scene_instance.load_robot.assert_called_once()
         MockTaskGen.assert_called_once()
         MockPlanner.assert_called_once()
-        MockRecorder.assert_called_with("vla_dataset.h5")
+        MockRecorder.assert_called_with("vla_dataset.h5", max_steps=main_gen.MAX_STEPS)
 
         # 2. Check Loop execution (1 episode)
         scene_instance.reset.assert_called_once()
+        # reset() already randomizes lighting; it must not be rebuilt twice
+        scene_instance.randomize_lighting.assert_not_called()
         task_gen_instance.reset_task.assert_called_once()
         # Ensure correct scene passed (mocked scene property)
         # We can't strictly verify scene.scene is passed if scene.scene is also a mock created on the fly,
         # but we can check call args.
 
         planner_instance.plan_grasp.assert_called_once()
-        recorder_instance.create_episode_group.assert_called_with(0)
+        recorder_instance.create_episode_group.assert_called_with(0, instruction="Pick up the cube")
 
         # 3. Check inner loop (actions)
         # 10 steps in trajectory
         self.assertEqual(scene_instance.step.call_count, 10)
         self.assertEqual(scene_instance.render.call_count, 10)
         self.assertEqual(recorder_instance.save_step.call_count, 10)
+        # Steps get row views of the planned trajectory, not converted copies
+        action = recorder_instance.save_step.call_args.kwargs['action']
+        self.assertEqual(action.dtype, np.float64)
+        self.assertTrue(np.shares_memory(action, dummy_traj))
+        recorder_instance.close_episode.assert_called_once_with(0)
+        MockRecorder.return_value.__exit__.assert_called_once()
 
         # Verify robot control was called
         self.assertEqual(scene_instance.robot.control_dofs_position.call_count, 10)
 
+    def test_find_method(self):
+        robot = MagicMock(spec=['control_joints', 'set_q'])
+        self.assertIs(main_gen.find_method(robot, ('control_dofs_position', 'control_joints', 'set_q')),
+                      robot.control_joints)
+        self.assertIsNone(main_gen.find_method(robot, ('get_pos',)))
+
+    @patch('vla_synthesis.main_generate.HDF5Recorder')
+    def test_generate_episode_writes_shard(self, MockRecorder):
+        scene, task_gen, planner = MagicMock(), MagicMock(), MagicMock()
+        target_obj = SimpleNamespace(get_pos=lambda: _TARGET_POS)
+        task_gen.reset_task.return_value = ("Pick up the cube", target_obj)
+        planner.plan_grasp.return_value = np.zeros((5, 9))
+        scene.render.return_value = (_RGB, _DEPTH, _SEG)
+
+        with patch.object(main_gen, '_worker_components', (scene, task_gen, planner)):
+            shard_path = main_gen.generate_episode(7)
+
+        self.assertEqual(shard_path, os.path.join(main_gen.SHARD_DIR, "ep_000007.h5"))
+        MockRecorder.assert_called_with(shard_path, max_steps=main_gen.MAX_STEPS, in_memory=True)
+        recorder_instance = MockRecorder.return_value.__enter__.return_value
+        self.assertEqual(recorder_instance.save_step.call_count, 5)
+        recorder_instance.close_episode.assert_called_once_with(7)
+
+    def test_import_loads_no_heavy_dependencies(self):
+        # Checked in a fresh interpreter: in this one, earlier tests have
+        # already imported h5py and the Genesis mock
+        code = ("import sys, vla_synthesis.main_generate; "
+                "sys.exit(sorted({'h5py', 'genesis'} & set(sys.modules)) or None)")
+        result = subprocess.run([sys.executable, '-c', code], cwd=project_root,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_concatenate_shards(self):
+        import h5py
+
+        instructions = ["push the cube", "lift the ball"]
+        shard_paths = []
+        for ep in range(2):
+            path = os.path.join(self.tmp_path, 'shards', f'ep_{ep:06d}.h5')
+            with HDF5Recorder(path) as recorder:
+                recorder.register_instructions(instructions)
+                recorder.save_step(ep, np.zeros((4, 4, 3), np.uint8), np.zeros(9),
+                                   instructions[ep], float(ep))
+            shard_paths.append(path)
+
+        save_path = os.path.join(self.tmp_path, 'dataset.h5')
+        main_gen.concatenate_shards(shard_paths, save_path)
+
+        with h5py.File(save_path, 'r') as f:
+            self.assertEqual(sorted(f), ['episode_0', 'episode_1'])
+            self.assertIsInstance(f.get('episode_1', getlink=True), h5py.ExternalLink)
+            self.assertEqual(f['episode_1']['rewards'][0], 1.0)
+            # Instruction IDs resolve through the combined file's vocabulary
+            vocab = f.attrs['instruction_vocab']
+            self.assertEqual(vocab[f['episode_1'].attrs['instruction_id']].decode(), "lift the ball")
+
+        # Shards recorded with a different vocabulary cannot be combined
+        with HDF5Recorder(shard_paths[1]) as recorder:
+            recorder.register_instructions(["open the drawer"])
+        with self.assertRaises(ValueError):
+            main_gen.concatenate_shards(shard_paths, save_path)
+
 if __name__ == '__main__':
     unittest.main()
@@ -31,25 +31,84 @@ class TestSimplePlanner(unittest.TestCase):
         # Check the shape of each step (9 joints)
         self.assertEqual(len(trajectory[0]), 9)
 
-        # Check for gripper closing logic
-        # Find the index where gripper closes (should transition from open to closed)
-        # We assume open is > 0.01 and closed is < 0.01
-        gripper_start_idx = -1
-        gripper_end_idx = -1
-
-        # Scan trajectory to find when gripper closes
-        # Gripper joints are usually last 2
-        for i, q in enumerate(trajectory):
-            gripper_val = q[-1]
-            if gripper_val < 0.01:
-                if gripper_start_idx == -1:
-                    gripper_start_idx = i
-            elif gripper_start_idx != -1 and gripper_end_idx == -1:
-                # Gripper re-opened? Shouldn't happen in this sequence
-                pass
-
-        # Verify gripper eventually closed
-        self.assertNotEqual(gripper_start_idx, -1, "Gripper did not close")
+        # Segments are written into a single contiguous array
+        self.assertIsInstance(trajectory, np.ndarray)
+        self.assertTrue(trajectory.flags['C_CONTIGUOUS'])
+
+        # Check for gripper closing logic: the gripper opens on the way to
+        # the pre-grasp pose, then closes at the grasp pose and stays closed.
+        # We assume open is > 0.01 and closed is < 0.01 (last joint)
+        closed = trajectory[:, -1] < 0.01
+        open_idx = np.argmax(~closed)
+        self.assertFalse(closed[open_idx], "Gripper never opened")
+        close_idx = open_idx + np.argmax(closed[open_idx:])
+        self.assertTrue(closed[close_idx], "Gripper did not close")
+        self.assertTrue(closed[close_idx:].all())
+
+    def test_plan_grasp_batched_ik(self):
+        # Robot whose IK returns one solution per target position
+        self.robot.inverse_kinematics.side_effect = lambda link, pos, quat: np.ones((len(pos), 9))
+        trajectory = self.planner.plan_grasp(self.robot, np.array([0.5, 0.0, 0.05]))
+
+        self.assertEqual(self.robot.inverse_kinematics.call_count, 1)
+        self.assertEqual(trajectory.shape[1], 9)
+
+    def test_plan_grasp_warm_start(self):
+        self.planner.plan_grasp(self.robot, np.array([0.5, 0.0, 0.05]))
+
+        # Batched probe, then three sequential solves seeded with the previous solution
+        calls = self.robot.inverse_kinematics.call_args_list
+        self.assertEqual(len(calls), 4)
+        np.testing.assert_array_equal(calls[1].kwargs['init_qpos'], np.zeros(9))
+        # Only the arm joints: the gripper columns are set in place afterwards
+        np.testing.assert_array_equal(calls[2].kwargs['init_qpos'][:7], np.ones(7))
+
+    def test_batched_ik_kept_after_solver_error(self):
+        target_pos = np.array([0.5, 0.0, 0.05])
+        self.robot.inverse_kinematics.side_effect = ValueError("target out of reach")
+        # A genuine solver error is reported, not taken as "no batching"
+        with self.assertRaises(RuntimeError):
+            self.planner.plan_grasp(self.robot, target_pos)
+
+        self.robot.inverse_kinematics.reset_mock(side_effect=True)
+        self.robot.inverse_kinematics.side_effect = lambda link, pos, quat: np.ones((len(pos), 9))
+        self.planner.plan_grasp(self.robot, target_pos)
+        self.assertEqual(self.robot.inverse_kinematics.call_count, 1)
+
+    def test_warm_start_kept_after_solver_type_error(self):
+        calls = []
+
+        def inverse_kinematics(link, pos, quat, init_qpos=None):
+            if np.ndim(pos) == 2:
+                raise TypeError("batched targets are not supported")
+            calls.append(init_qpos)
+            if fail:
+                raise TypeError("solver bug")
+            return np.ones(9)
+
+        self.robot.inverse_kinematics = inverse_kinematics
+        fail = True
+        with self.assertRaises(RuntimeError):
+            self.planner.plan_grasp(self.robot, np.array([0.5, 0.0, 0.05]))
+
+        fail = False
+        calls.clear()
+        self.planner.plan_grasp(self.robot, np.array([0.5, 0.0, 0.05]))
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(init_qpos is not None for init_qpos in calls))
+
+    def test_no_warm_start_without_init_qpos(self):
+        calls = []
+
+        def inverse_kinematics(link, pos, quat):
+            calls.append(pos)
+            return np.ones(9)
+
+        self.robot.inverse_kinematics = inverse_kinematics
+        trajectory = self.planner.plan_grasp(self.robot, np.array([0.5, 0.0, 0.05]))
+        # Batched probe returns a single solution, then three plain solves
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(trajectory.shape[1], 9)
 
     def test_interpolate(self):
         start = np.zeros(9)
@@ -58,8 +117,18 @@ class TestSimplePlanner(unittest.TestCase):
         traj = self.planner.interpolate(start, end, steps)
 
         self.assertEqual(len(traj), steps)
+        self.assertEqual(traj.shape, (steps, 9))
         np.testing.assert_array_almost_equal(traj[0], start)
         np.testing.assert_array_almost_equal(traj[-1], end)
 
+    def test_interpolate_into_out(self):
+        out = np.empty((5, 3))
+        traj = self.planner.interpolate([0, 0, 0], [1, 2, 3], 5, out=out)
+
+        self.assertIs(traj, out)
+        np.testing.assert_array_almost_equal(out[2], [0.5, 1.0, 1.5])
+        np.testing.assert_array_equal(out[-1], [1, 2, 3])
+        np.testing.assert_allclose(out, self.planner.interpolate([0, 0, 0], [1, 2, 3], 5))
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,19 +2,65 @@ import unittest
 import numpy as np
 import h5py
 import os
-import shutil
-import tempfile
-from vla_synthesis.src.recorder import HDF5Recorder
+import threading
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+from vla_synthesis.src.recorder import EpisodeBuffer, HDF5Recorder
+
+class FakeTensor:
+    """Minimal stand-in for a torch tensor that refuses implicit conversion."""
+    def __init__(self, data):
+        self.data = np.array(data)
+
+    def detach(self):
+        return self
+
+    def clone(self):
+        return FakeTensor(self.data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+    def __array__(self, *args, **kwargs):
+        raise TypeError("can't convert cuda tensor to numpy")
+
+class GatedTensor(FakeTensor):
+    """FakeTensor whose host copy, made on the writer thread, waits for `gate`."""
+    def __init__(self, data, gate):
+        super().__init__(data)
+        self.gate = gate
+
+    def clone(self):
+        return self
+
+    def numpy(self):
+        self.gate.wait()
+        return self.data
 
 class TestHDF5Recorder(unittest.TestCase):
-    def setUp(self):
-        self.test_dir = tempfile.mkdtemp()
-        self.h5_path = os.path.join(self.test_dir, 'test.h5')
-        self.recorder = HDF5Recorder(self.h5_path)
+    background = True
 
-    def tearDown(self):
+    @pytest.fixture(autouse=True)
+    def _recorder(self, tmp_path):
+        self.test_dir = str(tmp_path)
+        self.h5_path = os.path.join(self.test_dir, 'test.h5')
+        self.recorder = HDF5Recorder(self.h5_path, background=self.background)
+        yield
         self.recorder.close()
-        shutil.rmtree(self.test_dir)
 
     def test_create_episode_group(self):
         self.recorder.create_episode_group(0)
@@ -23,6 +69,39 @@ class TestHDF5Recorder(unittest.TestCase):
         with h5py.File(self.h5_path, 'r') as f:
             self.assertIn('episode_0', f)
 
+    def test_file_uses_paged_aggregation(self):
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            strategy, persist, _ = f.id.get_create_plist().get_file_space_strategy()
+            self.assertEqual(strategy, h5py.h5f.FSPACE_STRATEGY_PAGE)
+            self.assertTrue(persist)
+            self.assertEqual(f.id.get_create_plist().get_file_space_page_size(), 1 << 20)
+
+        # Reopening an existing file must not try to change its creation settings
+        HDF5Recorder(self.h5_path).close()
+
+    def test_no_modification_times(self):
+        self.recorder.save_step(0, np.zeros((10, 10, 3), dtype=np.uint8),
+                                np.zeros(5, dtype=np.float32), "step", 0.0, np.zeros(6))
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            grp = f['episode_0']
+            self.assertFalse(grp.id.get_create_plist().get_obj_track_times())
+            for name in ('observations', 'actions', 'rewards', 'states'):
+                self.assertFalse(grp[name].id.get_create_plist().get_obj_track_times())
+
+    def test_mode_w_replaces_file(self):
+        self.recorder.save_step(0, np.zeros((10, 10, 3), dtype=np.uint8),
+                                np.zeros(5, dtype=np.float32), "step", 0.0)
+        self.recorder.close()
+
+        with HDF5Recorder(self.h5_path, mode='w', background=self.background) as recorder:
+            self.assertNotIn('episode_0', recorder.file)
+        with self.assertRaises(ValueError):
+            HDF5Recorder(self.h5_path, mode='r')
+
     def test_save_step(self):
         obs = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
         action = np.random.rand(7).astype(np.float32)
@@ -39,24 +118,35 @@ class TestHDF5Recorder(unittest.TestCase):
 
             self.assertIn('observations', grp)
             self.assertIn('actions', grp)
-            self.assertIn('instructions', grp)
             self.assertIn('rewards', grp)
             self.assertIn('states', grp)
 
             self.assertEqual(grp['observations'].shape, (1, 480, 640, 3))
             self.assertEqual(grp['actions'].shape, (1, 7))
-            self.assertEqual(grp['instructions'].shape, (1,))
             self.assertEqual(grp['rewards'].shape, (1,))
             self.assertEqual(grp['states'].shape, (1, 6))
 
             np.testing.assert_array_equal(grp['observations'][0], obs)
             np.testing.assert_array_equal(grp['actions'][0], action)
-            self.assertEqual(grp['instructions'][0].decode('utf-8'), instruction)
+            self.assertEqual(grp.attrs['instruction'], instruction)
             self.assertEqual(grp['rewards'][0], reward)
             np.testing.assert_array_equal(grp['states'][0], state)
 
             # Check compression
-            self.assertEqual(grp['observations'].compression, 'gzip')
+            self.assertEqual(grp['observations'].compression, 'lzf')
+            self.assertIsNone(grp['actions'].compression)
+
+    def test_full_frame_chunks(self):
+        obs = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+        self.recorder.save_step(0, obs, np.zeros(7, dtype=np.float32), "step", 1.0)
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            grp = f['episode_0']
+            # One ~900 KB frame per chunk, many low-dimensional rows per chunk
+            self.assertEqual(grp['observations'].chunks, (1, 480, 640, 3))
+            self.assertEqual(grp['actions'].chunks, (HDF5Recorder.ACT_CHUNK_LEN, 7))
+            self.assertEqual(grp['rewards'].chunks, (HDF5Recorder.REW_CHUNK_LEN,))
 
     def test_multiple_steps(self):
         steps = 5
@@ -71,12 +161,479 @@ class TestHDF5Recorder(unittest.TestCase):
 
         with h5py.File(self.h5_path, 'r') as f:
             grp = f['episode_0']
-            self.assertEqual(grp['observations'].shape, (5, 10, 10, 3))
-            self.assertEqual(grp['rewards'].shape, (5,))
-            self.assertEqual(grp['rewards'][4], 4.0)
+            # Each dataset is read whole, in one call, rather than per step
+            observations = grp['observations'][:]
+            self.assertEqual(observations.shape, (5, 10, 10, 3))
+            self.assertFalse(observations.any())
+            np.testing.assert_array_equal(grp['rewards'][:], np.arange(steps, dtype=np.float32))
+
+    def test_flush_writes_all_episodes(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        for ep in range(2):
+            for i in range(3):
+                self.recorder.save_step(ep, obs, action, "step", float(i))
+
+        self.recorder.flush()
+        for ep in range(2):
+            grp = self.recorder.file[f'episode_{ep}']
+            self.assertEqual(grp['observations'].shape, (3, 10, 10, 3))
+            np.testing.assert_array_equal(grp['rewards'][:], [0.0, 1.0, 2.0])
+
+        # Episodes stay open and keep appending after a flush
+        self.recorder.save_step(0, obs, action, "step", 3.0)
+        self.recorder.flush()
+        self.assertEqual(self.recorder.file['episode_0']['rewards'].shape, (4,))
+
+    def test_flush_episode_appends(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        for i in range(3):
+            self.recorder.save_step(0, obs, action, "step", float(i))
+        self.recorder.flush_episode(0)
+
+        # Nothing is written until the episode is flushed
+        for i in range(3, 5):
+            self.recorder.save_step(0, obs, action, "step", float(i))
+        self.recorder.sync()
+        self.assertEqual(self.recorder.file['episode_0']['rewards'].shape, (3,))
+
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+        grp = self.recorder.file['episode_0']
+        self.assertEqual(grp['observations'].shape, (5, 10, 10, 3))
+        self.assertEqual(grp['observations'].chunks[0], HDF5Recorder.OBS_CHUNK_LEN)
+        np.testing.assert_array_equal(grp['rewards'][:], np.arange(5, dtype=np.float32))
+
+    def test_flush_every(self):
+        recorder = HDF5Recorder(os.path.join(self.test_dir, 'auto.h5'), flush_every=4,
+                                in_memory=True, backing_store=False, background=self.background)
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        for i in range(10):
+            recorder.save_step(0, obs, action, "step", float(i))
+        recorder.sync()
+
+        # Two full blocks were flushed; the remaining steps are still buffered
+        self.assertEqual(recorder.file['episode_0']['rewards'].shape, (8,))
+
+        recorder.flush()
+        grp = recorder.file['episode_0']
+        self.assertEqual(grp['observations'].shape, (10, 10, 10, 3))
+        np.testing.assert_array_equal(grp['rewards'][:], np.arange(10, dtype=np.float32))
+        recorder.close()
+
+    def test_create_episode_group_with_shapes(self):
+        self.recorder.create_episode_group(0, obs_shape=(10, 10, 3), action_dim=5, state_dim=6)
+        self.recorder.sync()
+
+        grp = self.recorder.file['episode_0']
+        self.assertEqual(grp['observations'].chunks, (HDF5Recorder.OBS_CHUNK_LEN, 10, 10, 3))
+        self.assertEqual(grp['actions'].chunks, (HDF5Recorder.ACT_CHUNK_LEN, 5))
+        self.assertEqual(grp['states'].chunks, (HDF5Recorder.ACT_CHUNK_LEN, 6))
+        self.assertEqual(grp['rewards'].chunks, (HDF5Recorder.REW_CHUNK_LEN,))
+
+        for i in range(3):
+            self.recorder.save_step(0, np.zeros((10, 10, 3), dtype=np.uint8),
+                                    np.zeros(5, dtype=np.float32), "step", float(i))
+        self.recorder.close_episode(0)
+        self.recorder.sync()
+        self.assertEqual(grp['actions'].shape, (3, 5))
+        # No state was given, so the pre-created states are zero-filled
+        np.testing.assert_array_equal(grp['states'][:], np.zeros((3, 6)))
+
+    def test_est_len_preallocates(self):
+        self.recorder.create_episode_group(0, est_len=50)
+        for i in range(3):
+            self.recorder.save_step(0, np.zeros((10, 10, 3), dtype=np.uint8),
+                                    np.zeros(5, dtype=np.float32), "step", float(i))
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+
+        grp = self.recorder.file['episode_0']
+        self.assertEqual(grp['actions'].shape, (50, 5))
+        self.assertEqual(grp['actions'].chunks, (50, 5))
+        self.assertEqual(grp['actions'].id.get_create_plist().get_alloc_time(),
+                         h5py.h5d.ALLOC_TIME_EARLY)
+
+        self.recorder.close_episode(0)
+        self.recorder.sync()
+        self.assertEqual(grp['actions'].shape, (3, 5))
+        self.assertEqual(grp['observations'].shape, (3, 10, 10, 3))
+
+    def test_close_episode_trims_preallocated(self):
+        recorder = HDF5Recorder(os.path.join(self.test_dir, 'prealloc.h5'), max_steps=20,
+                                in_memory=True, backing_store=False)
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        for i in range(3):
+            recorder.save_step(0, obs, action, "step", float(i))
+        recorder.flush_episode(0)
+        recorder.sync()
+        grp = recorder.file['episode_0']
+        self.assertEqual(grp['observations'].shape, (20, 10, 10, 3))
+
+        recorder.close_episode(0)
+        recorder.sync()
+        self.assertEqual(grp['observations'].shape, (3, 10, 10, 3))
+        self.assertEqual(grp['rewards'].shape, (3,))
+        recorder.close()
+
+    def test_instruction_stored_once(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        self.recorder.create_episode_group(0, instruction="pick up the cube")
+        self.recorder.save_step(0, obs, action, "pick up the cube", 0.0)
+
+        with self.assertRaises(ValueError):
+            self.recorder.save_step(0, obs, action, "grasp the red item", 0.0)
+
+        self.recorder.close()
+        with h5py.File(self.h5_path, 'r') as f:
+            grp = f['episode_0']
+            self.assertEqual(grp.attrs['instruction'], "pick up the cube")
+            self.assertNotIn('instructions', grp)
+
+    def test_writer_error_reported(self):
+        recorder = HDF5Recorder(os.path.join(self.test_dir, 'error.h5'), in_memory=True,
+                                backing_store=False)
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        recorder.save_step(0, obs, np.zeros(5), "step", 0.0)
+        # Mismatched observation shape fails inside the writer thread
+        recorder.save_step(0, np.zeros((3, 3, 3)), np.zeros(5), "step", 0.0)
+
+        with self.assertRaises(ValueError):
+            recorder.sync()
+        recorder.close()
+
+    def test_writer_error_discards_queued_steps(self):
+        if not self.background:
+            self.skipTest("foreground recorder has no queue")
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        gate = threading.Event()
+        try:
+            # Hold the writer on the first step while the failing one and
+            # the steps behind it are queued
+            self.recorder.save_step(0, GatedTensor(obs, gate), action, "step", 0.0)
+            self.recorder.save_step(0, np.zeros((3, 3, 3)), action, "step", 1.0)
+            for i in range(2, 5):
+                self.recorder.save_step(0, obs, action, "step", float(i))
+        finally:
+            gate.set()
+
+        with self.assertRaises(ValueError):
+            while True:
+                self.recorder.save_step(0, obs, action, "step", 9.0)
+        # Nothing queued before the error was reported reaches the file
+        self.recorder.save_step(0, obs, action, "step", 5.0)
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            np.testing.assert_array_equal(f['episode_0/rewards'][:], [0.0, 5.0])
+
+    @unittest.skipUnless(hdf5plugin, "hdf5plugin is not installed")
+    def test_blosc_compression(self):
+        path = os.path.join(self.test_dir, 'blosc.h5')
+        obs = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+
+        with HDF5Recorder(path, compression='blosc') as recorder:
+            recorder.save_step(0, obs, np.zeros(5, dtype=np.float32), "step", 0.0)
+
+        with h5py.File(path, 'r') as f:
+            dset = f['episode_0/observations']
+            filter_id, _, cd_values, _ = dset.id.get_create_plist().get_filter(0)
+            self.assertEqual(filter_id, hdf5plugin.BLOSC_ID)
+            # Compression level and shuffle mode
+            self.assertEqual(cd_values[4:6], (HDF5Recorder.BLOSC_LEVEL, hdf5plugin.Blosc.BITSHUFFLE))
+            np.testing.assert_array_equal(dset[0], obs)
+
+    def test_direct_chunk_writes(self):
+        frames = np.random.randint(0, 255, (75, 8, 8, 3), dtype=np.uint8)
+        frames[:40] //= 8  # Mix compressible and incompressible chunks
+        action = np.zeros(5, dtype=np.float32)
+
+        for compression in ('lzf', 'gzip', 'blosc'):
+            with self.subTest(compression=compression):
+                path = os.path.join(self.test_dir, f'direct_{compression}.h5')
+                recorder = HDF5Recorder(path, flush_every=None, compression=compression,
+                                        background=self.background)
+                # Unaligned first flush, then whole chunks plus a partial tail
+                for i, frame in enumerate(frames):
+                    recorder.save_step(0, frame, action, "step", float(i))
+                    if i == 4:
+                        recorder.flush_episode(0)
+                recorder.close()
+
+                with h5py.File(path, 'r') as f:
+                    dset = f['episode_0/observations']
+                    np.testing.assert_array_equal(dset[:], frames)
+                    if compression == 'gzip':
+                        # A whole chunk is stored as the dataset's filter would store it
+                        chunk_len = dset.chunks[0]
+                        filter_mask, chunk = dset.id.read_direct_chunk((chunk_len, 0, 0, 0))
+                        self.assertEqual(filter_mask, 0)
+                        self.assertEqual(zlib.decompress(chunk),
+                                         frames[chunk_len:2 * chunk_len].tobytes())
+
+    def test_swmr_reader_sees_flushed_steps(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        self.recorder.create_episode_group(0, instruction="step", obs_shape=obs.shape,
+                                           action_dim=5)
+        self.recorder.start_swmr()
+
+        for i in range(3):
+            self.recorder.save_step(0, obs, action, "step", float(i))
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+
+        with h5py.File(self.h5_path, 'r', libver='latest', swmr=True) as f:
+            rewards = f['episode_0/rewards']
+            np.testing.assert_array_equal(rewards[:], [0.0, 1.0, 2.0])
+
+            self.recorder.save_step(0, obs, action, "step", 3.0)
+            self.recorder.flush_episode(0)
+            self.recorder.sync()
+            rewards.refresh()
+            self.assertEqual(rewards.shape, (4,))
+            self.assertEqual(f['episode_0/observations'].shape, (4, 10, 10, 3))
+
+    def test_save_step_tensors(self):
+        obs = np.random.randint(0, 255, (10, 10, 3), dtype=np.uint8)
+        action = np.arange(5, dtype=np.float32)
+
+        self.recorder.save_step(0, FakeTensor(obs), FakeTensor(action), "step", 0.0)
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+
+        grp = self.recorder.file['episode_0']
+        np.testing.assert_array_equal(grp['observations'][0], obs)
+        np.testing.assert_array_equal(grp['actions'][0], action)
+
+    def test_instruction_vocabulary(self):
+        self.recorder.register_instructions(["push the cube", "pick up the cube"])
+        self.recorder.create_episode_group(0, instruction="pick up the cube")
+        self.recorder.save_step(1, np.zeros((10, 10, 3), dtype=np.uint8),
+                                np.zeros(5, dtype=np.float32), "open the drawer", 0.0)
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            self.assertEqual(f.attrs['instruction_vocab'].dtype, np.dtype('S16'))
+            vocab = [v.decode() for v in f.attrs['instruction_vocab']]
+            self.assertEqual(vocab, ["push the cube", "pick up the cube", "open the drawer"])
+            self.assertEqual(f['episode_0'].attrs['instruction_id'], 1)
+            self.assertEqual(f['episode_1'].attrs['instruction_id'], 2)
+
+        # Reopening the file continues the same vocabulary
+        with HDF5Recorder(self.h5_path) as recorder:
+            recorder.create_episode_group(2, instruction="open the drawer")
+        with h5py.File(self.h5_path, 'r') as f:
+            self.assertEqual(f['episode_2'].attrs['instruction_id'], 2)
+            self.assertEqual(len(f.attrs['instruction_vocab']), 3)
+
+    def test_long_instruction_vocabulary(self):
+        long_instruction = "pick up the cube " * 10
+        self.recorder.register_instructions(["push the cube", long_instruction])
+        self.recorder.close()
+
+        # Too long for fixed-length entries, so stored as vlen strings
+        with h5py.File(self.h5_path, 'r') as f:
+            self.assertEqual(list(f.attrs['instruction_vocab']), ["push the cube", long_instruction])
+        # Reopening the file decodes them into the same IDs
+        with HDF5Recorder(self.h5_path) as recorder:
+            recorder.create_episode_group(0, instruction=long_instruction)
+        with h5py.File(self.h5_path, 'r') as f:
+            self.assertEqual(len(f.attrs['instruction_vocab']), 2)
+            self.assertEqual(f['episode_0'].attrs['instruction_id'], 1)
+
+    def test_step_writer_reset_on_overwrite(self):
+        action = np.zeros(5, dtype=np.float32)
+        self.recorder.save_step(0, FakeTensor(np.zeros((10, 10, 3), dtype=np.uint8)),
+                                FakeTensor(action), "step", 0.0)
+        self.recorder.sync()
+
+        # Recreating the episode must not keep writing into the old buffer,
+        # with the old observation shape
+        obs = np.random.randint(0, 255, (4, 4, 3), dtype=np.uint8)
+        self.recorder.create_episode_group(0)
+        self.recorder.save_step(0, obs, np.arange(5, dtype=np.float64), "step", 1.0)
+        self.recorder.close_episode(0)
+        self.recorder.sync()
+
+        grp = self.recorder.file['episode_0']
+        self.assertEqual(grp['observations'].dtype, np.uint8)
+        np.testing.assert_array_equal(grp['observations'][:], [obs])
+        self.assertEqual(grp['actions'].dtype, np.float32)
+        np.testing.assert_array_equal(grp['actions'][:], [np.arange(5)])
+        np.testing.assert_array_equal(grp['rewards'][:], [1.0])
+
+    def test_flush_reuses_dataset_handles(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        self.recorder.save_step(0, obs, action, "step", 0.0)
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+
+        # Later flushes write through the cached handles, without looking
+        # the episode or its datasets up by name
+        with patch.object(h5py.Group, '__getitem__', side_effect=AssertionError("lookup")):
+            for i in range(1, 5):
+                self.recorder.save_step(0, obs, action, "step", float(i))
+                self.recorder.flush_episode(0)
+            self.recorder.sync()
+        np.testing.assert_array_equal(self.recorder.file['episode_0']['rewards'][:],
+                                      np.arange(5, dtype=np.float32))
+
+    def test_queue_absorbs_a_flush(self):
+        if not self.background:
+            self.skipTest("foreground recorder has no queue")
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        steps = 2 * self.recorder.flush_every
+        gate = threading.Event()
+
+        def record():
+            for i in range(steps):
+                self.recorder.save_step(0, obs, action, "step", float(i + 1))
+
+        caller = threading.Thread(target=record)
+        try:
+            # While the writer is busy, two flushes' worth of steps are
+            # queued without blocking the caller
+            self.recorder.save_step(0, GatedTensor(obs, gate), action, "step", 0.0)
+            caller.start()
+            caller.join(timeout=5)
+            self.assertFalse(caller.is_alive(), "save_step blocked on a busy writer")
+        finally:
+            gate.set()
+            if caller.is_alive():
+                caller.join()
+        self.recorder.flush()
+        np.testing.assert_array_equal(self.recorder.file['episode_0/rewards'][:],
+                                      np.arange(steps + 1, dtype=np.float32))
+
+    def test_quantized_actions(self):
+        path = os.path.join(self.test_dir, 'quant.h5')
+        actions = np.random.uniform(-3, 3, (20, 7)).astype(np.float32)
+        actions[0, 0] = 10.0  # Out of range, clipped to the upper bound
+
+        with HDF5Recorder(path, quantize_range={'actions': (-np.pi, np.pi)}) as recorder:
+            for i, action in enumerate(actions):
+                recorder.save_step(0, np.zeros((4, 4, 3), dtype=np.uint8), action, "step", float(i))
+
+        with h5py.File(path, 'r') as f:
+            dset = f['episode_0/actions']
+            self.assertEqual(dset.dtype, np.uint16)
+            decoded = dset[:] * dset.attrs['scale'] + dset.attrs['offset']
+            actions[0, 0] = np.pi
+            np.testing.assert_allclose(decoded, actions, atol=1e-4)
+
+        with self.assertRaises(ValueError):
+            HDF5Recorder(path, quantize_range={'rewards': (0, 1)})
+
+    def test_quantized_states_without_state(self):
+        path = os.path.join(self.test_dir, 'quant_states.h5')
+        obs = np.zeros((4, 4, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        with HDF5Recorder(path, flush_every=2, quantize_range={'states': (-1, 1)},
+                          background=self.background) as recorder:
+            # The second flush window has no state at all
+            recorder.save_step(0, obs, action, "step", 0.0, np.full(3, 0.5, dtype=np.float32))
+            for i in range(1, 4):
+                recorder.save_step(0, obs, action, "step", float(i))
+            # Pre-created states that never get a value
+            recorder.create_episode_group(1, state_dim=3)
+            for i in range(3):
+                recorder.save_step(1, obs, action, "step", float(i))
+
+        with h5py.File(path, 'r') as f:
+            for ep, expected in ((0, [[0.5] * 3] + [[0.0] * 3] * 3), (1, np.zeros((3, 3)))):
+                dset = f[f'episode_{ep}/states']
+                decoded = dset[:] * dset.attrs['scale'] + dset.attrs['offset']
+                np.testing.assert_allclose(decoded, expected, atol=1e-4)
+
+    def test_quantized_states_arriving_late(self):
+        obs = np.zeros((4, 4, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+        state = np.array([0.5, 1.0, 2.0], dtype=np.float32)
+
+        # A scalar range has one fill value; per-dimension ranges do not
+        for label, bounds in (('scalar', (-1, 3)), ('per_dim', ([-1, 0, -2], [1, 2, 4]))):
+            with self.subTest(bounds=label):
+                path = os.path.join(self.test_dir, f'late_{label}.h5')
+                with HDF5Recorder(path, flush_every=2, quantize_range={'states': bounds},
+                                  background=self.background) as recorder:
+                    # The first flush window has no state at all
+                    for i in range(3):
+                        recorder.save_step(0, obs, action, "step", float(i))
+                    recorder.save_step(0, obs, action, "step", 3.0, state)
+
+                with h5py.File(path, 'r') as f:
+                    dset = f['episode_0/states']
+                    decoded = dset[:] * dset.attrs['scale'] + dset.attrs['offset']
+                    np.testing.assert_allclose(decoded, [[0, 0, 0]] * 3 + [state], atol=1e-4)
+
+    def test_in_memory_file(self):
+        path = os.path.join(self.test_dir, 'memory.h5')
+        recorder = HDF5Recorder(path, in_memory=True,
+                                background=self.background)
+        self.assertEqual(recorder.file.driver, 'core')
+
+        with patch.object(recorder.file, 'flush', wraps=recorder.file.flush) as flush:
+            recorder.save_step(0, np.zeros((4, 4, 3), dtype=np.uint8), np.zeros(5, dtype=np.float32), "step", 1.0)
+            recorder.sync()
+            flush.assert_not_called()
+            # Written to disk at the episode boundary
+            recorder.close_episode(0)
+            recorder.sync()
+            flush.assert_called_once()
+        recorder.close()
+
+        with h5py.File(path, 'r') as f:
+            np.testing.assert_array_equal(f['episode_0/rewards'][:], [1.0])
+
+    def test_in_memory_without_backing_store(self):
+        path = os.path.join(self.test_dir, 'scratch.h5')
+        recorder = HDF5Recorder(path, in_memory=True, backing_store=False,
+                                background=self.background)
+        recorder.save_step(0, np.zeros((4, 4, 3), dtype=np.uint8), np.zeros(5, dtype=np.float32), "step", 1.0)
+        recorder.close_episode(0)
+        recorder.sync()
+        np.testing.assert_array_equal(recorder.file['episode_0/rewards'][:], [1.0])
+        recorder.close()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            HDF5Recorder(os.path.join(self.test_dir, 'bad.h5'), compression='zip')
+
+    @unittest.skipUnless(cv2, "OpenCV is not installed")
+    def test_jpeg_observations(self):
+        path = os.path.join(self.test_dir, 'jpeg.h5')
+        obs = np.zeros((48, 64, 3), dtype=np.uint8)
+        obs[..., 0] = 200  # Red frame
+        with HDF5Recorder(path, observation_codec='jpeg') as recorder:
+            for i in range(3):
+                recorder.save_step(0, obs, np.zeros(5), "step", float(i))
+
+        with h5py.File(path, 'r') as f:
+            dset = f['episode_0']['observations']
+            self.assertEqual(dset.shape, (3,))
+            self.assertEqual(dset.attrs['codec'], 'jpeg')
+            self.assertLess(dset[0].nbytes, obs.nbytes)
+            decoded = cv2.cvtColor(cv2.imdecode(dset[0], cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+            np.testing.assert_allclose(decoded, obs, atol=8)
 
     def test_overwrite_episode(self):
         self.recorder.create_episode_group(0)
+        self.recorder.sync()
         # Write something manually to check overwrite
         self.recorder.file['episode_0'].attrs['foo'] = 'bar'
 
@@ -87,6 +644,20 @@ class TestHDF5Recorder(unittest.TestCase):
             self.assertIn('episode_0', f)
             self.assertNotIn('foo', f['episode_0'].attrs)
 
+    def test_save_step_without_copy(self):
+        obs = np.random.randint(0, 255, (10, 10, 3), dtype=np.uint8)
+        action = np.arange(5, dtype=np.float64)
+
+        self.recorder.save_step(0, obs, action, "step", 0.0, copy=False)
+        self.recorder.flush_episode(0)
+        self.recorder.sync()
+
+        grp = self.recorder.file['episode_0']
+        np.testing.assert_array_equal(grp['observations'][0], obs)
+        # Still converted to the stored dtype, by the buffer copy
+        self.assertEqual(grp['actions'].dtype, np.float32)
+        np.testing.assert_array_equal(grp['actions'][0], action)
+
     def test_state_late_arrival(self):
         # Step 0: no state
         obs = np.zeros((10, 10, 3), dtype=np.uint8)
@@ -107,10 +678,58 @@ class TestHDF5Recorder(unittest.TestCase):
             self.assertIn('states', grp)
             self.assertEqual(grp['states'].shape, (2, 3))
 
-            # First state should be 0 (default fill)
-            np.testing.assert_array_equal(grp['states'][0], np.zeros(3))
-            # Second state should be 1
-            np.testing.assert_array_equal(grp['states'][1], np.ones(3))
+            # First state should be 0 (default fill), second state should be 1
+            np.testing.assert_array_equal(grp['states'][:], [np.zeros(3), np.ones(3)])
+
+    def test_state_stops_arriving(self):
+        obs = np.zeros((10, 10, 3), dtype=np.uint8)
+        action = np.zeros(5, dtype=np.float32)
+
+        self.recorder.save_step(0, obs, action, "step", 0.0, np.ones(3, dtype=np.float32))
+        self.recorder.flush_episode(0)
+        # Later blocks without a state are not written but still read as zeros
+        for i in range(1, 3):
+            self.recorder.save_step(0, obs, action, "step", float(i))
+        self.recorder.save_step(1, obs, action, "step", 0.0)
+        self.recorder.close()
+
+        with h5py.File(self.h5_path, 'r') as f:
+            np.testing.assert_array_equal(f['episode_0/states'][:], [[1, 1, 1], [0, 0, 0], [0, 0, 0]])
+            # An episode without any state has no states dataset
+            self.assertNotIn('states', f['episode_1'])
+
+class TestHDF5RecorderForeground(TestHDF5Recorder):
+    """Runs the same tests with file operations on the calling thread."""
+    background = False
+
+class TestEpisodeBuffer(unittest.TestCase):
+    def test_append_grows_and_converts(self):
+        buf = EpisodeBuffer(capacity=2)
+        for i in range(5):
+            buf.append(np.full((4, 4, 3), i, dtype=np.float64), np.ones(3), float(i))
+
+        self.assertEqual(buf.size, 5)
+        self.assertGreaterEqual(buf.obs.shape[0], 5)
+        self.assertEqual(buf.obs.dtype, np.uint8)
+        self.assertEqual(buf.act.dtype, np.float32)
+        np.testing.assert_array_equal(buf.rew[:5], np.arange(5))
+        self.assertIsNone(buf.state)
+
+    def test_clear_reuses_arrays(self):
+        buf = EpisodeBuffer(capacity=4)
+        for i in range(3):
+            buf.append(np.zeros((4, 4, 3)), np.ones(3), float(i), np.full(2, i + 1))
+        arrays = (buf.obs, buf.act, buf.rew, buf.state)
+
+        buf.clear()
+        # A window whose state starts late must not see the previous states
+        buf.append(np.zeros((4, 4, 3)), np.ones(3), 0.0)
+        buf.append(np.zeros((4, 4, 3)), np.ones(3), 1.0, np.full(2, 9))
+        buf.append(np.zeros((4, 4, 3)), np.ones(3), 2.0)
+
+        for before, after in zip(arrays, (buf.obs, buf.act, buf.rew, buf.state)):
+            self.assertIs(before, after)
+        np.testing.assert_array_equal(buf.state[:3], [[0, 0], [9, 9], [0, 0]])
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,10 +3,10 @@ import sys
 import numpy as np
 from unittest.mock import MagicMock, patch
 import os
+from types import SimpleNamespace
+import pytest
 
-# Mock genesis module before importing SceneManager
-if 'genesis' not in sys.modules:
-    sys.modules['genesis'] = MagicMock()
+# Genesis is mocked for the whole session in conftest.py
 import genesis as gs
 
 # Ensure we can import the module
@@ -14,6 +14,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'
 
 from vla_synthesis.src.scene_manager import SceneManager
 
+# Camera images with the dtypes Genesis returns, shared by all tests
+_RGB = np.zeros((480, 640, 3), np.uint8)
+_DEPTH = np.zeros((480, 640), np.float32)
+_SEG = np.zeros((480, 640), np.int32)
+
+@pytest.mark.integration
 class TestSceneManager(unittest.TestCase):
     def setUp(self):
         # Reset the mock for each test
@@ -35,34 +41,51 @@ class TestSceneManager(unittest.TestCase):
         gs.Scene.assert_called_with(show_viewer=False)
         self.assertEqual(self.manager.scene, self.mock_scene)
 
-    def test_load_robot_franka(self):
-        """Test loading robot with Franka asset."""
-        # Setup gs.morphs.Franka
-        gs.morphs.Franka = MagicMock()
-
-        self.manager.load_robot()
-
-        # Check Plane creation
-        gs.morphs.Plane.assert_called()
-        # Check that add_entity was called with the result of Plane()
-        # Note: We can't easily match the exact object instance unless we mock the return of Plane()
-        # But we can verify add_entity was called.
-        self.assertTrue(self.mock_scene.add_entity.called)
-
-        # Check Franka creation
-        gs.morphs.Franka.assert_called_with(fixed=True, pos=(0, 0, 0))
-        self.assertIsNotNone(self.manager.robot)
+    def test_load_robot(self):
+        """Test loading the robot from each available asset type."""
+        # Asset classes missing from gs.morphs for each case; the loader
+        # prefers Franka, then Panda, then falls back to MJCF
+        cases = {
+            'franka': (),
+            'panda': ('Franka',),
+            'mjcf': ('Franka', 'Panda'),
+        }
+        for which, missing in cases.items():
+            with self.subTest(which=which):
+                gs.morphs = MagicMock()
+                for name in missing:
+                    delattr(gs.morphs, name)
+                self.mock_scene.reset_mock()
+
+                if which == 'mjcf':
+                    with self.assertWarns(UserWarning):
+                        self.manager.load_robot()
+                else:
+                    self.manager.load_robot()
+
+                # Check Plane creation
+                gs.morphs.Plane.assert_called()
+                # Plane and robot are both added to the scene
+                self.assertEqual(self.mock_scene.add_entity.call_count, 2)
+
+                if which == 'mjcf':
+                    (call,) = gs.morphs.MJCF.mock_calls
+                    self.assertEqual(call.kwargs['pos'], (0, 0, 0))
+                    self.assertTrue(call.kwargs['fixed'])
+                else:
+                    asset = getattr(gs.morphs, which.capitalize())
+                    asset.assert_called_with(fixed=True, pos=(0, 0, 0))
+                self.assertIsNotNone(self.manager.robot)
 
     def test_setup_camera_initial(self):
         """Test initial camera setup."""
         self.manager.setup_camera()
 
-        self.mock_scene.add_camera.assert_called_once()
+        (call,) = self.mock_scene.add_camera.mock_calls
         self.assertIsNotNone(self.manager.camera)
 
         # Check call args to verify randomization happened
-        call_args = self.mock_scene.add_camera.call_args
-        kwargs = call_args[1]
+        kwargs = call.kwargs
 
         base_pos = np.array([1.0, 0.0, 0.8])
         look_at_target = np.array([0.5, 0.0, 0.0])
@@ -86,6 +109,21 @@ class TestSceneManager(unittest.TestCase):
         # Should call set_pose on the existing camera
         mock_cam.set_pose.assert_called_once()
 
+    def test_seeded_randomization(self):
+        """Test that the same seed reproduces the camera and light poses."""
+        poses = []
+        for _ in range(2):
+            manager = SceneManager(debug=False, seed=123)
+            manager.reset()
+            poses.append((self.mock_scene.add_camera.call_args[1]['pos'],
+                           gs.morphs.Light.call_args[1]['pos'],
+                           gs.morphs.Light.call_args[1]['intensity']))
+            self.mock_scene.reset_mock()
+
+        for first, second in zip(*poses):
+            np.testing.assert_array_equal(first, second)
+        self.assertTrue(2.0 <= poses[0][2] <= 5.0)
+
     def test_randomize_lighting(self):
         """Test lighting randomization."""
         self.manager.randomize_lighting()
@@ -101,23 +139,53 @@ class TestSceneManager(unittest.TestCase):
 
     def test_render(self):
         """Test rendering."""
-        # Setup mock camera
+        # Setup mock camera without fused rendering
         mock_cam = MagicMock()
+        mock_cam.render.return_value = None
         self.manager.camera = mock_cam
 
         # Setup return values for camera methods
-        mock_cam.get_color.return_value = np.zeros((480, 640, 3))
-        mock_cam.get_depth.return_value = np.zeros((480, 640))
-        mock_cam.get_segmentation.return_value = np.zeros((480, 640))
+        mock_cam.get_color.return_value = _RGB
+        mock_cam.get_depth.return_value = _DEPTH
+        mock_cam.get_segmentation.return_value = _SEG
 
         rgb, depth, seg = self.manager.render()
 
-        mock_cam.render.assert_called_once()
+        # One fused probe, then the per-buffer path
+        self.assertEqual(mock_cam.render.call_count, 2)
+        mock_cam.render.assert_called_with()
         mock_cam.get_color.assert_called()
         mock_cam.get_depth.assert_called()
         mock_cam.get_segmentation.assert_called()
 
         self.assertIsInstance(rgb, np.ndarray)
+        mock_cam.get_color.assert_called_with(return_numpy=True)
+
+        # Without the host copy, the camera's own tensors are passed through
+        self.manager.render(to_numpy=False)
+        mock_cam.get_color.assert_called_with(return_numpy=False)
+        # The probe is not repeated
+        self.assertEqual(mock_cam.render.call_count, 3)
+
+    def test_render_fused(self):
+        """Test rendering all images in one camera.render() call."""
+        images = (_RGB, _DEPTH, _SEG, None)
+        calls = []
+
+        def render(rgb, depth, segmentation):
+            calls.append((rgb, depth, segmentation))
+            return images
+
+        # A stub without get_color/get_depth/get_segmentation, so only the
+        # fused path can produce the images
+        self.manager.camera = SimpleNamespace(render=render)
+
+        for _ in range(2):
+            rgb, depth, seg = self.manager.render()
+
+        self.assertEqual(calls, [(True, True, True)] * 2)
+        self.assertIs(rgb, images[0])
+        self.assertIs(seg, images[2])
 
     def test_reset(self):
         """Test reset calls randomization methods."""
@@ -150,5 +218,9 @@ class TestSceneManager(unittest.TestCase):
         self.assertEqual(depth.dtype, np.float32)
         self.assertEqual(seg.dtype, np.int32)
 
+        # The fallback images are shared and must not be modified
+        self.assertIs(self.manager.render()[0], rgb)
+        self.assertFalse(rgb.flags.writeable)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,122 +1,146 @@
+import copy
+import re
 import unittest
-from unittest.mock import MagicMock, patch
-import sys
-import numpy as np
-
-# Mock genesis before importing task_generator
-# We need to ensure that when task_generator imports genesis, it gets our mock
-if "genesis" not in sys.modules:
-    sys.modules["genesis"] = MagicMock()
+from unittest.mock import MagicMock
 
+# Genesis is mocked once for the whole session in conftest.py, so importing
+# this module installs nothing; the morph constructors are set in setUpClass
 import genesis as gs
 
-# Define mock morphs (moved to setUp)
 from vla_synthesis.src.task_generator import TaskGenerator
 
+class FakeScene:
+    """Minimal stand-in for a Genesis scene that records entity changes."""
+    def __init__(self):
+        self.add_calls = []
+        self.remove_calls = []
+
+    def add_entity(self, morph, **kwargs):
+        self.add_calls.append((morph, kwargs))
+        return "mock_entity_handle"
+
+    def remove_entity(self, entity):
+        self.remove_calls.append(entity)
+
 class TestTaskGenerator(unittest.TestCase):
-    def setUp(self):
-        # Configure gs mock for this test suite
-        gs.morphs = MagicMock()
+    @classmethod
+    def setUpClass(cls):
+        # Configure gs mock once for this test suite. The spec limits it to
+        # the constructors TaskGenerator uses, so a typo or a new morph type
+        # fails loudly instead of fabricating a child mock.
+        gs.morphs = MagicMock(spec=["Box", "Sphere", "Cylinder"])
         gs.morphs.Box = MagicMock(return_value="mock_box_morph")
         gs.morphs.Sphere = MagicMock(return_value="mock_sphere_morph")
         gs.morphs.Cylinder = MagicMock(return_value="mock_cylinder_morph")
 
-        self.scene = MagicMock()
-        self.scene.add_entity.return_value = "mock_entity_handle"
-
-        self.generator = TaskGenerator()
-
-    def test_reset_task_creates_object_and_instruction(self):
-        # Run reset_task
-        self.generator.reset_task(self.scene)
-
-        # Verify an entity was added
-        self.scene.add_entity.assert_called_once()
-        args, _ = self.scene.add_entity.call_args
-        morph = args[0]
-        self.assertIn(morph, ["mock_box_morph", "mock_sphere_morph", "mock_cylinder_morph"])
-
-        # Verify instruction is set
-        instruction, entity = self.generator.get_instruction()
-        self.assertIsNotNone(instruction)
-        self.assertIsInstance(instruction, str)
-        self.assertGreater(len(instruction), 0)
-
-        # Verify entity is correct
-        self.assertEqual(entity, "mock_entity_handle")
-
-        # Verify instruction contains relevant words
-        # Since randomization is involved, we can't be 100% sure which object was picked,
-        # but we can check if it contains a color or object name from DB
-        found_object = False
-        for obj_name in self.generator.ASSET_DB.keys():
-            if obj_name in instruction:
-                found_object = True
-                break
-
-        # Also check for "item" which is used in one of the templates
-        if "item" in instruction:
-            found_object = True
-
-        self.assertTrue(found_object, f"Instruction '{instruction}' does not contain any known object name")
-
-    def test_reset_task_position_bounds(self):
-        # We need to capture the arguments passed to the morph constructor to verify position
-        # Since we use lambdas in ASSET_DB, the morph constructor is called inside reset_task
-
-        # Let's patch the morph constructors to inspect arguments
-        with patch("genesis.morphs.Box") as mock_box, \
-             patch("genesis.morphs.Sphere") as mock_sphere, \
-             patch("genesis.morphs.Cylinder") as mock_cylinder:
-
-            # Configure side effects to return dummy morphs so add_entity doesn't fail
-            mock_box.return_value = "mock_box_morph"
-            mock_sphere.return_value = "mock_sphere_morph"
-            mock_cylinder.return_value = "mock_cylinder_morph"
+        # Built once; tests get shallow copies with fresh per-task state
+        cls._generator_template = TaskGenerator()
 
-            self.generator.reset_task(self.scene)
+        # Any object name, or "item" which is used in one of the templates
+        cls._asset_names = tuple(TaskGenerator.ASSET_DB)
+        cls._asset_pat = re.compile("|".join(map(re.escape, cls._asset_names + ("item",))))
 
-            # Find which mock was called
-            called_mock = None
-            if mock_box.called:
-                called_mock = mock_box
-            elif mock_sphere.called:
-                called_mock = mock_sphere
-            elif mock_cylinder.called:
-                called_mock = mock_cylinder
-
-            self.assertIsNotNone(called_mock, "No morph constructor was called")
+    def setUp(self):
+        # Keep the configured morph constructors, drop their call history
+        gs.morphs.reset_mock()
 
-            # Get arguments
-            args, kwargs = called_mock.call_args
-            # We used keyword arguments in lambda: Box(pos=pos, ...)
-            pos = kwargs.get('pos')
+        self.scene = FakeScene()
 
-            self.assertIsNotNone(pos, "Position argument missing")
-            x, y, z = pos
+        self.generator = copy.copy(self._generator_template)
+        self.generator.target_object_entity = None
+        self.generator.instruction = ""
+        # Seeded, so every test sees the same objects, colors and positions
+        self.generator.seed(0)
 
-            # Verify bounds
-            self.assertTrue(0.3 <= x <= 0.7, f"x={x} out of bounds [0.3, 0.7]")
-            self.assertTrue(-0.2 <= y <= 0.2, f"y={y} out of bounds [-0.2, 0.2]")
-            self.assertEqual(z, 0.05, f"z={z} expected 0.05")
+    def test_reset_task(self):
+        # We need to capture the arguments passed to the morph constructor to verify position
+        # Since we use lambdas in ASSET_DB, the morph constructor is called inside reset_task.
+        # The constructors configured in setUpClass are plain attributes of
+        # gs.morphs with a fresh call history, so they are inspected directly
+        # instead of being patched for this test.
+        morph_mocks = (gs.morphs.Box, gs.morphs.Sphere, gs.morphs.Cylinder)
+
+        # A fixed range of seeds deterministically covers every morph type;
+        # each seed checks the spawned object, its position and the
+        # instruction from one reset_task call
+        seen = set()
+        for seed in range(12):
+            with self.subTest(seed=seed):
+                gs.morphs.reset_mock()
+                scene = FakeScene()
+                self.generator.target_object_entity = None
+                self.generator.seed(seed)
+                instruction, entity = self.generator.reset_task(scene)
+
+                # Exactly one morph constructor is called, exactly once
+                ((called_mock, call),) = [(m, c) for m in morph_mocks
+                                          for c in m.mock_calls]
+                seen.add(called_mock.return_value)
+
+                # Verify its morph was added as the target entity
+                self.assertEqual(len(scene.add_calls), 1)
+                self.assertEqual(scene.add_calls[0][0], called_mock.return_value)
+                self.assertEqual(entity, "mock_entity_handle")
+                self.assertEqual(self.generator.get_instruction(), (instruction, entity))
+
+                # We used keyword arguments in lambda: Box(pos=pos, ...)
+                pos = call.kwargs.get('pos')
+
+                self.assertIsNotNone(pos, "Position argument missing")
+                x, y, z = pos
+
+                # Verify bounds
+                self.assertTrue(0.3 <= x <= 0.7, f"x={x} out of bounds [0.3, 0.7]")
+                self.assertTrue(-0.2 <= y <= 0.2, f"y={y} out of bounds [-0.2, 0.2]")
+                self.assertEqual(z, 0.05, f"z={z} expected 0.05")
+
+                # Verify instruction contains relevant words: an object name
+                # from DB, or "item" for the color-only template
+                self.assertIsInstance(instruction, str)
+                self.assertTrue(self._asset_pat.search(instruction),
+                                f"Instruction '{instruction}' does not contain any known object name")
+
+        self.assertEqual(seen, {"mock_box_morph", "mock_sphere_morph", "mock_cylinder_morph"})
 
     def test_clear_previous_object(self):
-        # First call to set an object
-        self.generator.reset_task(self.scene)
-        first_entity = self.generator.target_object_entity
-        self.assertIsNotNone(first_entity)
+        # Stand in for an entity spawned by an earlier reset_task
+        self.generator.target_object_entity = "prev_handle"
 
-        # Configure remove_entity mock
-        self.scene.remove_entity = MagicMock()
-
-        # Second call should trigger removal
+        # The next reset should trigger removal
         self.generator.reset_task(self.scene)
 
-        # Verify remove_entity called with first_entity
-        self.scene.remove_entity.assert_called_with(first_entity)
-
-        # Verify new entity is different (or at least stored)
-        self.assertIsNotNone(self.generator.target_object_entity)
+        # Verify remove_entity called with the previous entity
+        self.assertEqual(self.scene.remove_calls, ["prev_handle"])
+
+        # Verify new entity is stored
+        self.assertEqual(self.generator.target_object_entity, "mock_entity_handle")
+
+    def test_seeded_reset_is_reproducible(self):
+        runs = []
+        for _ in range(2):
+            generator = TaskGenerator(seed=7)
+            runs.append([generator.reset_task(self.scene)[0] for _ in range(5)])
+            runs[-1].append(gs.morphs.Box.call_args or gs.morphs.Sphere.call_args
+                            or gs.morphs.Cylinder.call_args)
+            gs.morphs.reset_mock()
+
+        self.assertEqual(runs[0], runs[1])
+
+    def test_colors_are_not_black(self):
+        for name, rgb in self.generator.COLOR_DB.items():
+            self.assertNotEqual(tuple(rgb), (0.0, 0.0, 0.0), name)
+
+    def test_instruction_vocabulary(self):
+        vocab = self.generator.instruction_vocabulary()
+
+        # Color-less and object-less templates collapse duplicates
+        self.assertEqual(len(vocab), len(set(vocab)))
+        for name in self._asset_names:
+            self.assertIn(f"Move the {name}", vocab)
+        self.assertIn("Grasp the red item", vocab)
+        for _ in range(20):
+            instruction, _ = self.generator.reset_task(self.scene)
+            self.assertIn(instruction, vocab)
 
 if __name__ == "__main__":
     unittest.main()